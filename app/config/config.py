@@ -8,6 +8,8 @@ load_dotenv()
 class AppSettings(BaseSettings):
     app_name: str = os.getenv('APP_NAME')
     secret: str = os.getenv("SECRET")
+    app_env: str = os.getenv("APP_ENV", "production")
+    log_level: str = os.getenv("LOG_LEVEL", "INFO")
 
 
 class DBSettings(BaseSettings):
@@ -17,6 +19,8 @@ class DBSettings(BaseSettings):
     db_host: str = os.getenv("PG_HOST")
     db_name: str = os.getenv("PG_DB")
     sqlalchemy_url: str = os.getenv("SQLALCHEMY_URL")
+    slow_query_ms: float = float(os.getenv("SLOW_QUERY_MS", 200))
+    slow_query_explain_sample: float = float(os.getenv("SLOW_QUERY_EXPLAIN_SAMPLE", 0.1))
 
 
 settings = AppSettings()
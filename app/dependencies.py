@@ -1,8 +1,12 @@
-from fastapi import Depends
+from fastapi import Depends, HTTPException, status
 from fastapi_users import FastAPIUsers
-from app.models.courses import User
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_async_session
+from app.models.courses import User, CourseGroup, Grade
 from app.utils.auth_manager import get_user_manager
 from app.config.auth import auth_backend
+from app.utils.permissions import Permission, role_permissions
 
 fastapi_users = FastAPIUsers[User, int](
     get_user_manager,
@@ -16,3 +20,43 @@ def get_current_user(user: User = Depends(fastapi_users.current_user())):
 
 def get_current_superuser(user: User = Depends(fastapi_users.current_user(active=True, superuser=True))):
     return user
+
+
+def require_permission(*permissions: Permission):
+    required = Permission(0)
+    for permission in permissions:
+        required |= permission
+
+    def check_permission(user: User = Depends(fastapi_users.current_user(active=True))):
+        if user.is_superuser or role_permissions.has(user.role_id, required):
+            return user
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions")
+
+    return check_permission
+
+
+def _check_group_teacher(user: User, teacher_id):
+    # an unknown group or grade is left to the endpoint, which answers 404
+    if teacher_id is not None and teacher_id != user.id and not user.is_superuser:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You can only manage your own groups")
+    return user
+
+
+async def require_group_teacher(group_id: int, session: AsyncSession = Depends(get_async_session),
+                                user: User = Depends(require_permission(Permission.TEACH))):
+    """TEACH, and the group (from the group_id path parameter) has to be the teacher's own."""
+    if user.is_superuser:
+        return user
+    teacher_id = await session.scalar(select(CourseGroup.teacher_id).where(CourseGroup.id == group_id))
+    return _check_group_teacher(user, teacher_id)
+
+
+async def require_grade_teacher(grade_id: int, session: AsyncSession = Depends(get_async_session),
+                                user: User = Depends(require_permission(Permission.TEACH))):
+    """TEACH, and the grade has to belong to one of the teacher's groups."""
+    if user.is_superuser:
+        return user
+    teacher_id = await session.scalar(
+        select(CourseGroup.teacher_id).join(Grade, Grade.group_id == CourseGroup.id).where(Grade.id == grade_id)
+    )
+    return _check_group_teacher(user, teacher_id)
@@ -1,19 +1,120 @@
+import logging
+from contextlib import asynccontextmanager
+from uuid import uuid4
+
 import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
+from sqlalchemy.exc import SQLAlchemyError
 
+from app.config.config import settings
+from app.database import engine, async_session_maker
 from app.routers.users import router as auth_router
 from app.routers.courses import router as courses_router
 from app.routers.comments import router as comments_router
+from app.routers.monitoring import router as monitoring_router
+from app.services.courses import SchoolCommentsService
+from app.utils.grade_partitions import ensure_grade_partitions
+from app.utils.hashing import password_hashing_pool
+from app.utils.log_config import request_id, start_logging, stop_logging
+from app.utils.metrics import observe_request, register_pool, register_hashing_pool
+from app.utils.permissions import role_permissions
+from app.utils.profiling import ProfilingMiddleware
+from app.utils.query_guard import GUARD_ENABLED, install_query_guard, count_queries, match_route, report_request
+from app.utils.slow_queries import slow_query_log, install_slow_query_log
+from app.utils.timing import RequestTimings, request_timings, install_query_timing
+
+logger = logging.getLogger("app")
+timing_logger = logging.getLogger("app.timing")
+
+install_query_timing(engine)
+install_query_guard(engine)
+install_slow_query_log(engine, slow_query_log)
+register_pool(engine)
+register_hashing_pool(password_hashing_pool)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    start_logging(settings.log_level)
+    try:
+        async with engine.begin() as conn:
+            await ensure_grade_partitions(conn)
+    except (SQLAlchemyError, OSError) as e:
+        logger.error(f"could not create grade partitions: {str(e)}")
+    try:
+        async with async_session_maker() as session:
+            await SchoolCommentsService(session).load_fingerprints()
+    except (SQLAlchemyError, OSError) as e:
+        logger.error(f"could not load comment fingerprints: {str(e)}")
+    try:
+        async with async_session_maker() as session:
+            await role_permissions.refresh(session)
+    except (SQLAlchemyError, OSError) as e:
+        logger.error(f"could not load role permissions: {str(e)}")
+    yield
+    password_hashing_pool.shutdown()
+    stop_logging()
+
 
 app = FastAPI(
-    title="English School"
+    title="English School",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 app.include_router(auth_router)
 app.include_router(courses_router)
 
 app.include_router(comments_router)
+app.include_router(monitoring_router)
+
+
+@app.middleware("http")
+async def server_timing(request: Request, call_next):
+    timings = RequestTimings()
+    token = request_timings.set(timings)
+    route = match_route(app.routes, request.scope)
+    route_path = route.path if route is not None else "unmatched"
+    timings.route = f"{request.method} {route_path}"
+    try:
+        response = await call_next(request)
+    except Exception:
+        observe_request(request.method, route_path, 500, timings.breakdown()["total"] / 1000)
+        raise
+    finally:
+        request_timings.reset(token)
+    breakdown = timings.breakdown()
+    observe_request(request.method, route_path, response.status_code, breakdown["total"] / 1000)
+    response.headers["Server-Timing"] = timings.server_timing(breakdown)
+    timing_logger.info(
+        f"method={request.method} path={request.url.path} status={response.status_code} "
+        f"queries={timings.db_count} " + " ".join(f"{name}_ms={duration}" for name, duration in breakdown.items())
+    )
+    return response
+
+
+if GUARD_ENABLED:
+    @app.middleware("http")
+    async def query_guard(request: Request, call_next):
+        with count_queries() as counter:
+            response = await call_next(request)
+        report_request(match_route(app.routes, request.scope), counter, f"{request.method} {request.url.path}")
+        return response
+
+
+@app.middleware("http")
+async def request_id_context(request: Request, call_next):
+    # registered after server_timing, so it wraps it and the timing log line carries the id too
+    token = request_id.set(request.headers.get("X-Request-ID") or uuid4().hex)
+    try:
+        response = await call_next(request)
+        response.headers["X-Request-ID"] = request_id.get()
+        return response
+    finally:
+        request_id.reset(token)
+
 
 app.add_middleware(
     CORSMiddleware,
@@ -22,3 +123,4 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(ProfilingMiddleware)
@@ -1,9 +1,12 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Float, DateTime, Boolean, JSON, TIMESTAMP, Text
+from sqlalchemy import Column, Integer, String, ForeignKey, Float, DateTime, Boolean, JSON, TIMESTAMP, Text, Index, \
+    BigInteger, DDL, event, func, literal_column
 from sqlalchemy.orm import declarative_base, relationship
 from datetime import datetime
 
 Base = declarative_base()
 
+event.listen(Base.metadata, "before_create", DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+
 
 class Role(Base):
     __tablename__ = "role"
@@ -149,18 +152,39 @@ class CourseLevel(Base):
 
 class Grade(Base):
     __tablename__ = "grade"
+    # one partition per academic year, see app/utils/grade_partitions.py;
+    # the partition key has to be part of the primary key
+    __table_args__ = {"postgresql_partition_by": "RANGE (date_assigned)"}
 
-    id = Column(Integer, primary_key=True)
+    id = Column(Integer, primary_key=True, autoincrement=True)
     group_id = Column(Integer, ForeignKey("course_group.id"), nullable=False)
     user_id = Column(Integer, ForeignKey("user.id"), nullable=False)
     grade = Column(Integer, nullable=False)
     comments = Column(String, nullable=True)
-    date_assigned = Column(DateTime, default=datetime.utcnow, nullable=False)
+    date_assigned = Column(DateTime, default=datetime.utcnow, nullable=False, primary_key=True)
 
     group = relationship("CourseGroup")
     user = relationship("User")
 
 
+# student marks page: keyset scan per user on (date_assigned, id), group_id/grade served from the index
+Index("ix_grade_user_id_date_assigned", Grade.user_id, Grade.date_assigned.desc(), Grade.id.desc(),
+      postgresql_include=["group_id", "grade"])
+
+
+class GradeStats(Base):
+    __tablename__ = "grade_stats"
+
+    group_id = Column(Integer, ForeignKey("course_group.id", ondelete="CASCADE"), primary_key=True)
+    user_id = Column(Integer, ForeignKey("user.id", ondelete="CASCADE"), primary_key=True)
+    grades_count = Column(Integer, nullable=False, default=0)
+    grades_sum = Column(Integer, nullable=False, default=0)
+    grades_sum_sq = Column(Integer, nullable=False, default=0)
+    min_grade = Column(Integer, nullable=True)
+    max_grade = Column(Integer, nullable=True)
+    last_date = Column(DateTime, nullable=True)
+
+
 class SchoolComment(Base):
     __tablename__ = 'school_comments'
 
@@ -169,5 +193,33 @@ class SchoolComment(Base):
     comment = Column(Text, nullable=False)
     date_added = Column(DateTime, default=datetime.utcnow)
     is_verified = Column(Boolean, default=False)
+    fingerprint = Column(BigInteger, nullable=True)
 
     user = relationship("User", back_populates="school_comments")
+
+
+class RejectedComment(Base):
+    __tablename__ = 'rejected_comments'
+
+    id = Column(Integer, primary_key=True)
+    fingerprint = Column(BigInteger, nullable=False)
+    rejected_at = Column(DateTime, default=datetime.utcnow)
+
+
+# sort key of the public feed; date_added is nullable and undated (legacy) comments go to the end of the feed
+comment_feed_date = func.coalesce(SchoolComment.date_added, literal_column("'-infinity'::timestamp"))
+
+# public feed: only verified rows, already in (comment_feed_date, id) order for keyset pagination
+Index("ix_school_comments_verified_feed", comment_feed_date.desc(), SchoolComment.id.desc(),
+      postgresql_where=SchoolComment.is_verified == True)
+
+
+def _trigram_index(column):
+    return Index(f"ix_user_{column.key}_trgm", column, postgresql_using="gin",
+                 postgresql_ops={column.key: "gin_trgm_ops"})
+
+
+for _column in (User.first_name, User.last_name, User.email, User.phone_number):
+    _trigram_index(_column)
+Index("ix_user_registered_at_id", User.registered_at.desc(), User.id.desc())
+Index("uq_user_email_lower", func.lower(User.email), unique=True)
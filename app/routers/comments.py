@@ -1,18 +1,22 @@
-from typing import List
+from typing import List, Optional
 
-from fastapi import Depends, APIRouter
+from fastapi import Depends, APIRouter, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.database import get_async_session
-from app.dependencies import get_current_user, get_current_superuser
+from app.dependencies import get_current_user, get_current_superuser, require_permission
 from app.routers.courses import router
-from app.schemas.comments import VerifiedCommentsSchema, CommentsSchema
+from app.schemas.comments import VerifiedCommentsSchema, CommentsSchema, CommentsBulkActionSchema
 from app.services.courses import SchoolCommentsService
+from app.utils.permissions import Permission
+from app.utils.query_guard import query_budget
+from app.utils.timing import TimedRoute
 
-router = APIRouter(prefix="/comments", tags=['comments'])
+router = APIRouter(prefix="/comments", tags=['comments'], route_class=TimedRoute)
 
 
 @router.post('/add_school_comment')
+@query_budget(2)
 async def add_school_comment(comment: str, session: AsyncSession = Depends(get_async_session),
                              BaseUser=Depends(get_current_user)):
     service = SchoolCommentsService(session)
@@ -21,37 +25,61 @@ async def add_school_comment(comment: str, session: AsyncSession = Depends(get_a
 
 
 @router.post('/verify_comment/{comment_id}')
+@query_budget(2)
 async def verify_comment(comment_id: int, session: AsyncSession = Depends(get_async_session),
-                         BaseUser=Depends(get_current_superuser)):
+                         BaseUser=Depends(require_permission(Permission.MODERATE_COMMENTS))):
     service = SchoolCommentsService(session)
     res = await service.verify_comment(comment_id)
     return res
 
 
 @router.delete('/delete_comment/{comment_id}')
+@query_budget(3)
 async def delete_comment(comment_id: int, session: AsyncSession = Depends(get_async_session),
-                         BaseUser=Depends(get_current_superuser)):
+                         BaseUser=Depends(require_permission(Permission.MODERATE_COMMENTS))):
     service = SchoolCommentsService(session)
     res = await service.delete_comment(comment_id)
     return res
 
 
+@router.post('/verify_comments')
+@query_budget(2)
+async def verify_comments(data: CommentsBulkActionSchema, session: AsyncSession = Depends(get_async_session),
+                          BaseUser=Depends(require_permission(Permission.MODERATE_COMMENTS))):
+    service = SchoolCommentsService(session)
+    res = await service.verify_comments(data)
+    return res
+
+
+@router.post('/delete_comments')
+@query_budget(3)
+async def delete_comments(data: CommentsBulkActionSchema, session: AsyncSession = Depends(get_async_session),
+                          BaseUser=Depends(require_permission(Permission.MODERATE_COMMENTS))):
+    service = SchoolCommentsService(session)
+    res = await service.delete_comments(data)
+    return res
+
+
 @router.get('/get_unverified_comments')
+@query_budget(2)
 async def get_unverified_comments(session: AsyncSession = Depends(get_async_session),
-                                  BaseUser=Depends(get_current_superuser)):
+                                  BaseUser=Depends(require_permission(Permission.MODERATE_COMMENTS))):
     service = SchoolCommentsService(session)
     comments = await service.get_unverified_comments()
     return comments
 
 
 @router.get('/get_verified_comments')
-async def get_comments(session: AsyncSession = Depends(get_async_session)):
+@query_budget(1)
+async def get_comments(limit: int = Query(20, ge=1, le=100), cursor: Optional[str] = None,
+                       session: AsyncSession = Depends(get_async_session)):
     service = SchoolCommentsService(session)
-    comments = await service.get_verified_comments()
+    comments = await service.get_verified_comments(limit, cursor)
     return comments
 
 
 @router.get('/get_all_comments', response_model=List[CommentsSchema])
+@query_budget(2)
 async def get_all_comments(session: AsyncSession = Depends(get_async_session),
                            BaseUser=Depends(get_current_superuser)):
     service = SchoolCommentsService(session)
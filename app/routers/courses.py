@@ -1,23 +1,31 @@
+from datetime import datetime
 from typing import Optional
 
-from fastapi import Depends, APIRouter, status
+from fastapi import Depends, APIRouter, status, Query
 from sqlalchemy.ext.asyncio import AsyncSession
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, Response
 
 from app.schemas.users import BaseUser
-from app.dependencies import get_current_user, get_current_superuser
-from app.database import get_async_session
+from app.dependencies import get_current_user, get_current_superuser, require_permission, require_group_teacher, \
+    require_grade_teacher
+from app.database import get_async_session, async_session_maker
 from app.schemas.courses import LanguageSchema, CreateCourseSchema, EditCourseSchema
-from app.services.courses import LanguageService, CourseGroupService, GradeService
+from app.services.courses import LanguageService, CourseGroupService, GradeService, GradeAnalyticsService
 from app.schemas.courses import CourseFormatSchema, AgeGroupSchema, LevelSchema, CreateCourseRequestSchema, \
-    EditCourseRequest
-from app.services.courses import CourseFormatService, AgeGroupService, LevelService, CourseService, CourseRequestService
+    EditCourseRequest, BulkGradeSchema, GradeStatsScope, GradeTrendPeriod, GradebookFormat
+from app.services.courses import CourseFormatService, AgeGroupService, LevelService, CourseService, CourseRequestService, \
+    StudentDashboardService
 from app.services.users import check_grade
+from app.utils.gradebook import iter_gradebook_csv, gradebook_xlsx
+from app.utils.permissions import Permission
+from app.utils.query_guard import query_budget
+from app.utils.timing import TimedRoute
 
-router = APIRouter(prefix="/courses", tags=['courses'])
+router = APIRouter(prefix="/courses", tags=['courses'], route_class=TimedRoute)
 
 
 @router.post("/create_language")
+@query_budget(3)
 async def create_language(language: LanguageSchema, user: BaseUser = Depends(get_current_superuser),
                           session: AsyncSession = Depends(get_async_session)):
     language_service = LanguageService(session)
@@ -26,6 +34,7 @@ async def create_language(language: LanguageSchema, user: BaseUser = Depends(get
 
 
 @router.get("/get_languages")
+@query_budget(1)
 async def get_languages(session: AsyncSession = Depends(get_async_session)):
     language_service = LanguageService(session)
     languages = await language_service.get_languages()
@@ -33,6 +42,7 @@ async def get_languages(session: AsyncSession = Depends(get_async_session)):
 
 
 @router.get('/get_language_by_id/{language_id}')
+@query_budget(2)
 async def get_language(language_id: int, user: BaseUser = Depends(get_current_user),
                        session: AsyncSession = Depends(get_async_session)):
     language_service = LanguageService(session)
@@ -41,6 +51,7 @@ async def get_language(language_id: int, user: BaseUser = Depends(get_current_us
 
 
 @router.patch("/edit_language/{language_id}")
+@query_budget(3)
 async def edit_language(language_id: int, language: LanguageSchema, user: BaseUser = Depends(get_current_superuser),
                         session: AsyncSession = Depends(get_async_session)):
     language_service = LanguageService(session)
@@ -49,6 +60,7 @@ async def edit_language(language_id: int, language: LanguageSchema, user: BaseUs
 
 
 @router.delete("/delete_language/{language_id}")
+@query_budget(2)
 async def delete_language(language_id: int, user: BaseUser = Depends(get_current_superuser),
                           session: AsyncSession = Depends(get_async_session)):
     language_service = LanguageService(session)
@@ -57,6 +69,7 @@ async def delete_language(language_id: int, user: BaseUser = Depends(get_current
 
 
 @router.get("/get_course_formats")
+@query_budget(2)
 async def get_course_formats(user: BaseUser = Depends(get_current_user),
                              session: AsyncSession = Depends(get_async_session)):
     format_service = CourseFormatService(session)
@@ -65,6 +78,7 @@ async def get_course_formats(user: BaseUser = Depends(get_current_user),
 
 
 @router.get('/get_course_formats_by_id')
+@query_budget(2)
 async def get_course_formats_by_id(format_id: int, user: BaseUser = Depends(get_current_user),
                                    session: AsyncSession = Depends(get_async_session)):
     format_service = CourseFormatService(session)
@@ -73,6 +87,7 @@ async def get_course_formats_by_id(format_id: int, user: BaseUser = Depends(get_
 
 
 @router.post("/create_course_format")
+@query_budget(3)
 async def create_course_format(course_format: CourseFormatSchema, user: BaseUser = Depends(get_current_superuser),
                                session: AsyncSession = Depends(get_async_session)):
     format_service = CourseFormatService(session)
@@ -81,6 +96,7 @@ async def create_course_format(course_format: CourseFormatSchema, user: BaseUser
 
 
 @router.patch("/edit_course_format")
+@query_budget(3)
 async def edit_course_format(format_id: int, new_format: CourseFormatSchema,
                              user: BaseUser = Depends(get_current_superuser),
                              session: AsyncSession = Depends(get_async_session)):
@@ -90,6 +106,7 @@ async def edit_course_format(format_id: int, new_format: CourseFormatSchema,
 
 
 @router.delete("/delete_course_format")
+@query_budget(2)
 async def delete_course_format(format_id: int, user: BaseUser = Depends(get_current_superuser),
                                session: AsyncSession = Depends(get_async_session)):
     format_service = CourseFormatService(session)
@@ -98,6 +115,7 @@ async def delete_course_format(format_id: int, user: BaseUser = Depends(get_curr
 
 
 @router.post("/create_age_group")
+@query_budget(4)
 async def create_age_group(data: AgeGroupSchema, BaseUser=Depends(get_current_superuser),
                            session: AsyncSession = Depends(get_async_session)):
     age_group_service = AgeGroupService(session)
@@ -106,6 +124,7 @@ async def create_age_group(data: AgeGroupSchema, BaseUser=Depends(get_current_su
 
 
 @router.get('/get_age_group_by_id')
+@query_budget(2)
 async def get_age_group_by_id(group_id: int, BaseUser=Depends(get_current_user),
                               session: AsyncSession = Depends(get_async_session)):
     age_group_service = AgeGroupService(session)
@@ -114,6 +133,7 @@ async def get_age_group_by_id(group_id: int, BaseUser=Depends(get_current_user),
 
 
 @router.get("/get_age_groups")
+@query_budget(2)
 async def get_age_groups(BaseUser=Depends(get_current_user),
                          session: AsyncSession = Depends(get_async_session)):
     age_group_service = AgeGroupService(session)
@@ -122,6 +142,7 @@ async def get_age_groups(BaseUser=Depends(get_current_user),
 
 
 @router.delete("/delete_age_group/{group_id}")
+@query_budget(2)
 async def delete_age_group(group_id: int, BaseUser=Depends(get_current_superuser),
                            session: AsyncSession = Depends(get_async_session)):
     age_group_service = AgeGroupService(session)
@@ -130,6 +151,7 @@ async def delete_age_group(group_id: int, BaseUser=Depends(get_current_superuser
 
 
 @router.patch("/edit_age_group/{group_id}/")
+@query_budget(3)
 async def edit_age_group(group_id: int, group: AgeGroupSchema, BaseUser=Depends(get_current_superuser),
                          session: AsyncSession = Depends(get_async_session)):
     age_group_service = AgeGroupService(session)
@@ -138,6 +160,7 @@ async def edit_age_group(group_id: int, group: AgeGroupSchema, BaseUser=Depends(
 
 
 @router.post("/create_level")
+@query_budget(3)
 async def create_level(data: LevelSchema, BaseUser=Depends(get_current_superuser),
                        session: AsyncSession = Depends(get_async_session)):
     level_service = LevelService(session)
@@ -146,6 +169,7 @@ async def create_level(data: LevelSchema, BaseUser=Depends(get_current_superuser
 
 
 @router.get('/get_levels')
+@query_budget(2)
 async def get_levels(BaseUser=Depends(get_current_user),
                      session: AsyncSession = Depends(get_async_session)):
     level_service = LevelService(session)
@@ -154,6 +178,7 @@ async def get_levels(BaseUser=Depends(get_current_user),
 
 
 @router.get('/get_level_by_id')
+@query_budget(2)
 async def get_level_by_id(level_id: int, BaseUser=Depends(get_current_user),
                           session: AsyncSession = Depends(get_async_session)):
     level_service = LevelService(session)
@@ -162,6 +187,7 @@ async def get_level_by_id(level_id: int, BaseUser=Depends(get_current_user),
 
 
 @router.delete('/delete_level')
+@query_budget(2)
 async def delete_level(level_id: int, BaseUser=Depends(get_current_superuser),
                        session: AsyncSession = Depends(get_async_session)):
     level_service = LevelService(session)
@@ -170,6 +196,7 @@ async def delete_level(level_id: int, BaseUser=Depends(get_current_superuser),
 
 
 @router.patch('/edit_level/{level_id}/')
+@query_budget(3)
 async def edit_level(level_id: int, data: LevelSchema, BaseUser=Depends(get_current_superuser),
                      session: AsyncSession = Depends(get_async_session)):
     level_service = LevelService(session)
@@ -178,6 +205,7 @@ async def edit_level(level_id: int, data: LevelSchema, BaseUser=Depends(get_curr
 
 
 @router.post('/create_course')
+@query_budget(5)
 async def create_course(data: CreateCourseSchema, BaseUser=Depends(get_current_superuser),
                         session: AsyncSession = Depends(get_async_session)):
     course_service = CourseService(session)
@@ -186,6 +214,7 @@ async def create_course(data: CreateCourseSchema, BaseUser=Depends(get_current_s
 
 
 @router.get('/get_course_by_id/{course_id}')
+@query_budget(1)
 async def get_course_by_id(course_id: int, session: AsyncSession = Depends(get_async_session)):
     course_service = CourseService(session)
     result = await course_service.get_course_by_id(course_id)
@@ -193,13 +222,16 @@ async def get_course_by_id(course_id: int, session: AsyncSession = Depends(get_a
 
 
 @router.get('/get_courses')
-async def get_courses(session: AsyncSession = Depends(get_async_session)):
+@query_budget(1)
+async def get_courses(fields: Optional[str] = Query(None, description="comma-separated list, e.g. id,name"),
+                      session: AsyncSession = Depends(get_async_session)):
     course_service = CourseService(session)
-    result = await course_service.get_courses()
+    result = await course_service.get_courses(fields)
     return result
 
 
 @router.get('/get_user_courses/{user_id}')
+@query_budget(2)
 async def get_user_courses(user_id: Optional[int] = None, session: AsyncSession = Depends(get_async_session),
                            BaseUser=Depends(get_current_user)):
     service = CourseService(session)
@@ -208,6 +240,7 @@ async def get_user_courses(user_id: Optional[int] = None, session: AsyncSession
 
 
 @router.delete('/delete_course')
+@query_budget(2)
 async def delete_course(course_id: int, BaseUser=Depends(get_current_superuser),
                         session: AsyncSession = Depends(get_async_session)):
     course_service = CourseService(session)
@@ -216,6 +249,7 @@ async def delete_course(course_id: int, BaseUser=Depends(get_current_superuser),
 
 
 @router.patch('/edit_course/{course_id}')
+@query_budget(6)
 async def edit_course(course_id: int, data: EditCourseSchema, BaseUser=Depends(get_current_superuser),
                       session: AsyncSession = Depends(get_async_session)):
     course_service = CourseService(session)
@@ -224,6 +258,7 @@ async def edit_course(course_id: int, data: EditCourseSchema, BaseUser=Depends(g
 
 
 @router.post('/create_course_request')
+@query_budget(4)
 async def create_course_request(data: CreateCourseRequestSchema,
                                 session: AsyncSession = Depends(get_async_session),
                                 BaseUser=Depends(get_current_user)):
@@ -234,6 +269,7 @@ async def create_course_request(data: CreateCourseRequestSchema,
 
 
 @router.delete('/delete_course_request/{course_id}')
+@query_budget(2)
 async def delete_course_request(course_id: int, session: AsyncSession = Depends(get_async_session),
                                 BaseUser=Depends(get_current_superuser)):
     request_service = CourseRequestService(session)
@@ -242,6 +278,7 @@ async def delete_course_request(course_id: int, session: AsyncSession = Depends(
 
 
 @router.patch('/edit_course_request/{course_request_id}')
+@query_budget(3)
 async def edit_course_request(course_request_id: int, data: EditCourseRequest,
                               session: AsyncSession = Depends(get_async_session),
                               BaseUser=Depends(get_current_superuser)):
@@ -251,6 +288,7 @@ async def edit_course_request(course_request_id: int, data: EditCourseRequest,
 
 
 @router.get('/get_course_requests')
+@query_budget(2)
 async def get_course_requests(session: AsyncSession = Depends(get_async_session),
                               BaseUser=Depends(get_current_user)):
     request_service = CourseRequestService(session)
@@ -259,6 +297,7 @@ async def get_course_requests(session: AsyncSession = Depends(get_async_session)
 
 
 @router.get("/get_course_request/{request_id}")
+@query_budget(2)
 async def get_course_request(request_id: int, session: AsyncSession = Depends(get_async_session),
                              BaseUser=Depends(get_current_user)):
     request_service = CourseRequestService(session)
@@ -267,6 +306,7 @@ async def get_course_request(request_id: int, session: AsyncSession = Depends(ge
 
 
 @router.get('/get_user_course_requests/{user_id}')
+@query_budget(2)
 async def get_user_course_requests(user_id: Optional[int] = None, session: AsyncSession = Depends(get_async_session),
                                    BaseUser=Depends(get_current_user)):
     request_service = CourseRequestService(session)
@@ -277,6 +317,7 @@ async def get_user_course_requests(user_id: Optional[int] = None, session: Async
 
 
 @router.post('/create_group/{course_id}/{teacher_id}/{group_name}')
+@query_budget(2)
 async def create_group(course_id: int, teacher_id: int, group_name: str,
                        session: AsyncSession = Depends(get_async_session)):
     service = CourseGroupService(session)
@@ -285,6 +326,7 @@ async def create_group(course_id: int, teacher_id: int, group_name: str,
 
 
 @router.post('/add_user_to_group/{group_id}/{user_id}')
+@query_budget(3)
 async def add_user_to_group(group_id: int, user_id: int, session: AsyncSession = Depends(get_async_session),
                             BaseUser=Depends(get_current_superuser)):
     service = CourseGroupService(session)
@@ -293,6 +335,7 @@ async def add_user_to_group(group_id: int, user_id: int, session: AsyncSession =
 
 
 @router.get('/get_course_students')
+@query_budget(2)
 async def get_course_students(course_id: int, session: AsyncSession = Depends(get_async_session),
                               BaseUser=Depends(get_current_superuser)):
     service = CourseGroupService(session)
@@ -301,10 +344,14 @@ async def get_course_students(course_id: int, session: AsyncSession = Depends(ge
 
 
 @router.get('/get_groups')
-async def get_groups(session: AsyncSession = Depends(get_async_session),
+@query_budget(3)
+async def get_groups(course_id: Optional[int] = None, teacher_id: Optional[int] = None,
+                     limit: int = Query(50, ge=1, le=200), offset: int = Query(0, ge=0),
+                     fields: Optional[str] = Query(None, description="comma-separated list, e.g. id,group_name"),
+                     session: AsyncSession = Depends(get_async_session),
                      BaseUser=Depends(get_current_superuser)):
     service = CourseGroupService(session)
-    groups = await service.get_groups()
+    groups = await service.get_groups(course_id, teacher_id, limit, offset, fields)
     return groups
 
 # @router.get('/get_teacher_groups/{teacher_id}')
@@ -312,6 +359,7 @@ async def get_groups(session: AsyncSession = Depends(get_async_session),
 
 
 @router.get('/get_detailed_group/{group_id}')
+@query_budget(3)
 async def get_detailed_group(group_id: int, session: AsyncSession = Depends(get_async_session),
                              BaseUser=Depends(get_current_superuser)):
     service = CourseGroupService(session)
@@ -320,6 +368,7 @@ async def get_detailed_group(group_id: int, session: AsyncSession = Depends(get_
 
 
 @router.get('/get_teacher_groups/{teacher_id}')
+@query_budget(2)
 async def get_teacher_groups(teacher_id: int, session: AsyncSession = Depends(get_async_session),
                              BaseUser=Depends(get_current_user)):
     service = CourseGroupService(session)
@@ -327,7 +376,23 @@ async def get_teacher_groups(teacher_id: int, session: AsyncSession = Depends(ge
     return teacher_groups
 
 
+@router.get('/get_teacher_dashboard/{teacher_id}')
+@query_budget(4)
+async def get_teacher_dashboard(teacher_id: int, latest_grades: int = Query(5, ge=1, le=50),
+                                session: AsyncSession = Depends(get_async_session),
+                                BaseUser=Depends(require_permission(Permission.TEACH))):
+    if BaseUser.id != teacher_id and not BaseUser.is_superuser:
+        return JSONResponse(
+            status_code=status.HTTP_403_FORBIDDEN,
+            content="You can only view your own dashboard"
+        )
+    service = CourseGroupService(session)
+    dashboard = await service.get_teacher_dashboard(teacher_id, latest_grades)
+    return dashboard
+
+
 @router.delete('/remove_user_from_group/{user_id}/{group_id}')
+@query_budget(2)
 async def remove_user_from_group(user_id: int, group_id: int, session: AsyncSession = Depends(get_async_session),
                                  BaseUser=Depends(get_current_superuser)):
     service = CourseGroupService(session)
@@ -336,6 +401,7 @@ async def remove_user_from_group(user_id: int, group_id: int, session: AsyncSess
 
 
 @router.post('/add_teacher_to_group/{group_id}/{teacher_id}')
+@query_budget(4)
 async def add_teacher_to_group(group_id: int, teacher_id: int, session: AsyncSession = Depends(get_async_session),
                                BaseUser=Depends(get_current_superuser)):
     service = CourseGroupService(session)
@@ -344,17 +410,30 @@ async def add_teacher_to_group(group_id: int, teacher_id: int, session: AsyncSes
 
 
 @router.get('/get_student_marks')
-async def get_student_marks(session: AsyncSession = Depends(get_async_session),
+@query_budget(2)
+async def get_student_marks(limit: int = Query(50, ge=1, le=200), cursor: Optional[str] = None,
+                            date_from: Optional[datetime] = None, date_to: Optional[datetime] = None,
+                            group_id: Optional[int] = None,
+                            session: AsyncSession = Depends(get_async_session),
                             BaseUser=Depends(get_current_user)):
     service = GradeService(session)
-    marks = await service.get_student_marks(BaseUser.id)
+    marks = await service.get_student_marks(BaseUser.id, limit, cursor, date_from, date_to, group_id)
     return marks
 
 
+@router.get('/get_student_dashboard')
+@query_budget(4)
+async def get_student_dashboard(BaseUser=Depends(get_current_user)):
+    service = StudentDashboardService(async_session_maker)
+    dashboard = await service.get_dashboard(BaseUser.id)
+    return dashboard
+
+
 @router.post('/add_mark/{user_id}/{group_id}')
+@query_budget(5)
 async def add_mark(user_id: int, group_id: int, grade: int, comment: Optional[str] = None,
                    session: AsyncSession = Depends(get_async_session),
-                   BaseUser=Depends(get_current_superuser)):
+                   BaseUser=Depends(require_group_teacher)):
     if not check_grade(grade):
         return JSONResponse(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -365,27 +444,91 @@ async def add_mark(user_id: int, group_id: int, grade: int, comment: Optional[st
     return res
 
 
+@router.post('/add_marks/{group_id}')
+@query_budget(5)
+async def add_marks(group_id: int, data: BulkGradeSchema,
+                    session: AsyncSession = Depends(get_async_session),
+                    BaseUser=Depends(require_group_teacher)):
+    service = GradeService(session)
+    res = await service.add_grades(group_id, data.marks)
+    return res
+
+
 @router.delete('/delete_mark/{grade_id}')
+@query_budget(6)
 async def delete_mark(grade_id: int, session: AsyncSession = Depends(get_async_session),
-                      BaseUser=Depends(get_current_superuser)):
+                      BaseUser=Depends(require_grade_teacher)):
     service = GradeService(session)
     res = await service.delete_grade(grade_id)
     return res
 
 
 @router.patch('/edit_mark/{grade_id}')
+@query_budget(6)
 async def edit_mark(grade_id: int, grade: int = None, comment: str = None,
                     session: AsyncSession = Depends(get_async_session),
-                    BaseUser=Depends(get_current_superuser)):
+                    BaseUser=Depends(require_grade_teacher)):
     service = GradeService(session)
-    print(comment, grade)
     res = await service.update_grade(grade_id, grade, comment)
     return res
 
 
+@router.get('/get_grade_summary/{group_id}/{user_id}')
+@query_budget(2)
+async def get_grade_summary(group_id: int, user_id: int, session: AsyncSession = Depends(get_async_session),
+                            BaseUser=Depends(get_current_user)):
+    if BaseUser.id != user_id and not BaseUser.is_superuser:
+        return JSONResponse(
+            status_code=status.HTTP_403_FORBIDDEN,
+            content="You can only view your own grades"
+        )
+    service = GradeService(session)
+    summary = await service.get_grade_summary(group_id, user_id)
+    return summary
+
+
 @router.get('/get_group_marks/{group_id}')
-async def get_group_marks(group_id: int, session: AsyncSession = Depends(get_async_session),
-                          BaseUser=Depends(get_current_superuser)):
+@query_budget(3)
+async def get_group_marks(group_id: int, date_from: Optional[datetime] = None, date_to: Optional[datetime] = None,
+                          session: AsyncSession = Depends(get_async_session),
+                          BaseUser=Depends(require_group_teacher)):
     service = GradeService(session)
-    res = await service.get_group_marks(group_id)
+    res = await service.get_group_marks(group_id, date_from, date_to)
     return res
+
+
+@router.get('/get_grade_stats/{scope}/{scope_id}')
+@query_budget(4)
+async def get_grade_stats(scope: GradeStatsScope, scope_id: int, period: GradeTrendPeriod = GradeTrendPeriod.month,
+                          session: AsyncSession = Depends(get_async_session),
+                          BaseUser=Depends(get_current_superuser)):
+    service = GradeAnalyticsService(session)
+    stats = await service.get_grade_stats(scope, scope_id, period)
+    return stats
+
+
+@router.get('/get_group_gradebook/{group_id}')
+@query_budget(5)
+async def get_group_gradebook(group_id: int, format: GradebookFormat = GradebookFormat.json,
+                              date_from: Optional[datetime] = None, date_to: Optional[datetime] = None,
+                              session: AsyncSession = Depends(get_async_session),
+                              BaseUser=Depends(require_group_teacher)):
+    service = GradeService(session)
+    gradebook = await service.get_gradebook(group_id, date_from, date_to)
+    if gradebook is None:
+        return JSONResponse(
+            status_code=status.HTTP_404_NOT_FOUND,
+            content="Group not found"
+        )
+
+    filename = f"gradebook_{group_id}.{format.value}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    if format == GradebookFormat.csv:
+        return StreamingResponse(iter_gradebook_csv(gradebook), media_type="text/csv", headers=headers)
+    if format == GradebookFormat.xlsx:
+        return Response(
+            content=gradebook_xlsx(gradebook),
+            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            headers=headers
+        )
+    return gradebook
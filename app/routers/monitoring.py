@@ -0,0 +1,33 @@
+from fastapi import APIRouter, Depends, Query, HTTPException, status
+from fastapi.responses import PlainTextResponse, Response
+
+from app.dependencies import get_current_superuser
+from app.utils.metrics import registry
+from app.utils.profiling import profiles
+from app.utils.query_guard import query_budget
+from app.utils.slow_queries import slow_query_log
+from app.utils.timing import TimedRoute
+
+router = APIRouter(tags=['monitoring'], route_class=TimedRoute)
+
+
+@router.get('/metrics', response_class=PlainTextResponse, include_in_schema=False)
+@query_budget(0)
+def get_metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@router.get('/slow_queries')
+@query_budget(1)
+async def get_slow_queries(limit: int = Query(50, ge=1, le=200), BaseUser=Depends(get_current_superuser)):
+    return slow_query_log.recent(limit)
+
+
+@router.get('/profiles/{profile_id}')
+@query_budget(1)
+async def get_profile(profile_id: str, BaseUser=Depends(get_current_superuser)):
+    profile = profiles.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found")
+    media_type, content = profile
+    return Response(content=content, media_type=media_type)
@@ -1,18 +1,22 @@
-from fastapi import Depends, APIRouter, status
+import csv
+from datetime import datetime
+from typing import Optional
+
+from fastapi import Depends, APIRouter, status, Query, UploadFile, HTTPException
 from fastapi_users import FastAPIUsers
 from fastapi.responses import JSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.future import select
-
-from app.models.courses import User
 from app.config.auth import auth_backend
 from app.utils.auth_manager import get_user_manager
-from app.schemas.users import UserRead, UserCreate, BaseUser, UserUpdate
+from app.schemas.users import UserRead, UserCreate, BaseUser, UserUpdate, RolePermissionsSchema
 from app.dependencies import get_current_user, get_current_superuser
+from app.utils.permissions import Permission, role_permissions
 from app.database import get_async_session
-from app.services.users import UserServiceAdmin, email_validator
+from app.services.users import UserServiceAdmin, UserImportService, email_validator, parse_users_csv
+from app.utils.query_guard import query_budget
+from app.utils.timing import TimedRoute
 
-router = APIRouter(prefix="/auth")
+router = APIRouter(prefix="/auth", route_class=TimedRoute)
 
 fastapi_users = FastAPIUsers[BaseUser, int](
     get_user_manager,
@@ -32,16 +36,19 @@ router.include_router(
 
 
 @router.get('/verify_token', tags=['auth'])
+@query_budget(1)
 async def verify_token(user: BaseUser = Depends(get_current_user)):
     return JSONResponse(status_code=status.HTTP_200_OK, content="Token is valid")
 
 
 @router.get('/me', response_model=BaseUser, tags=['auth'])
+@query_budget(1)
 async def get_me(user: BaseUser = Depends(get_current_user)):
     return user
 
 
 @router.put('/me', response_model=UserUpdate, tags=['auth'])
+@query_budget(4)
 async def update_me(user_update: UserUpdate, user: BaseUser = Depends(get_current_user),
                     user_manager=Depends(get_user_manager)):
     await user_manager.update(user_update, user)
@@ -49,6 +56,7 @@ async def update_me(user_update: UserUpdate, user: BaseUser = Depends(get_curren
 
 
 @router.put('/update_user/{user_id}', response_model=UserUpdate, tags=['users'])
+@query_budget(2)
 async def update_user(user_id: int, user_update: UserUpdate, user: BaseUser = Depends(get_current_superuser),
                       session: AsyncSession = Depends(get_async_session)):
     service = UserServiceAdmin(session)
@@ -57,20 +65,43 @@ async def update_user(user_id: int, user_update: UserUpdate, user: BaseUser = De
 
 
 @router.delete('/me', tags=['auth'])
+@query_budget(10)
 async def delete_me(user: BaseUser = Depends(get_current_user), user_manager=Depends(get_user_manager)):
     await user_manager.delete(user)
     return JSONResponse(status_code=status.HTTP_200_OK, content="Account succesfully deleted")
 
 
 @router.get('/users', tags=['auth'])
-async def get_users(user: BaseUser = Depends(get_current_superuser),
+@query_budget(3)
+async def get_users(search: Optional[str] = Query(None, max_length=100), role_id: Optional[int] = None,
+                    is_active: Optional[bool] = None, is_verified: Optional[bool] = None,
+                    registered_from: Optional[datetime] = None, registered_to: Optional[datetime] = None,
+                    limit: int = Query(50, ge=1, le=200), offset: int = Query(0, ge=0),
+                    fields: Optional[str] = Query(None, description="comma-separated list, e.g. id,email"),
+                    user: BaseUser = Depends(get_current_superuser),
                     session: AsyncSession = Depends(get_async_session)):
-    result = await session.execute(select(User))
-    users = result.scalars().all()
+    service = UserServiceAdmin(session)
+    users = await service.get_users(search, role_id, is_active, is_verified, registered_from, registered_to,
+                                    limit, offset, fields)
     return users
 
 
+@router.post('/import_users', tags=['users'])
+@query_budget(12)
+async def import_users(file: UploadFile, user: BaseUser = Depends(get_current_superuser),
+                       session: AsyncSession = Depends(get_async_session)):
+    content = await file.read()
+    try:
+        rows = list(parse_users_csv(content))
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid CSV file: {str(e)}")
+    service = UserImportService(session)
+    res = await service.import_users(rows)
+    return res
+
+
 @router.get('/get_user/{user_id}', tags=['users'])
+@query_budget(2)
 async def get_user(user_id: int, user: BaseUser = Depends(get_current_superuser),
                    session: AsyncSession = Depends(get_async_session)):
     service = UserServiceAdmin(session)
@@ -79,6 +110,7 @@ async def get_user(user_id: int, user: BaseUser = Depends(get_current_superuser)
 
 
 @router.get('/get_roles', tags=['users'])
+@query_budget(2)
 async def get_roles(user: BaseUser = Depends(get_current_superuser),
                     session: AsyncSession = Depends(get_async_session)):
     service = UserServiceAdmin(session)
@@ -86,7 +118,18 @@ async def get_roles(user: BaseUser = Depends(get_current_superuser),
     return roles
 
 
+@router.put('/edit_role_permissions/{role_id}', tags=['users'])
+@query_budget(2)
+async def edit_role_permissions(role_id: int, data: RolePermissionsSchema,
+                                user: BaseUser = Depends(get_current_superuser),
+                                session: AsyncSession = Depends(get_async_session)):
+    service = UserServiceAdmin(session)
+    result = await service.edit_role_permissions(role_id, [name.value for name in data.permissions])
+    return result
+
+
 @router.post('/edit_user_role/{user_id}/{role_id}', tags=['users'])
+@query_budget(3)
 async def edit_role(user_id: int, role_id: int, user: BaseUser = Depends(get_current_superuser),
                     session: AsyncSession = Depends(get_async_session)):
     service = UserServiceAdmin(session)
@@ -95,6 +138,7 @@ async def edit_role(user_id: int, role_id: int, user: BaseUser = Depends(get_cur
 
 
 @router.delete('/delete_user/{user_id}', tags=['users'])
+@query_budget(2)
 async def delete_user(user_id: int, user: BaseUser = Depends(get_current_superuser),
                       session: AsyncSession = Depends(get_async_session)):
     service = UserServiceAdmin(session)
@@ -103,6 +147,7 @@ async def delete_user(user_id: int, user: BaseUser = Depends(get_current_superus
 
 
 @router.get('/is_admin', tags=['auth'])
+@query_budget(1)
 async def check_is_admin(session: AsyncSession = Depends(get_async_session),
                          user: BaseUser = Depends(get_current_user)):
     service = UserServiceAdmin(session)
@@ -111,12 +156,14 @@ async def check_is_admin(session: AsyncSession = Depends(get_async_session),
 
 
 @router.get('/is_teacher')
+@query_budget(1)
 async def check_is_teacher(session: AsyncSession = Depends(get_async_session),
                            user: BaseUser = Depends(get_current_user)):
-    return user.role_id == 3
+    return role_permissions.has(user.role_id, Permission.TEACH)
 
 
 @router.get('/get_teachers')
+@query_budget(1)
 async def get_teachers(session: AsyncSession = Depends(get_async_session)):
     service = UserServiceAdmin(session)
     teachers = await service.get_teachers()
@@ -124,6 +171,7 @@ async def get_teachers(session: AsyncSession = Depends(get_async_session)):
 
 
 @router.get('/validate_email')
+@query_budget(0)
 async def validate_email(email: str):
     result = await email_validator(email)
     return result
@@ -11,7 +11,7 @@ class UserCommentSchema(BaseModel):
 
 class VerifiedCommentsSchema(BaseModel):
     comment: str
-    date_added: datetime
+    date_added: Optional[datetime] = None
     user: UserCommentSchema
     model_config = ConfigDict(from_attributes=True)
 
@@ -19,3 +19,14 @@ class VerifiedCommentsSchema(BaseModel):
 class CommentsSchema(VerifiedCommentsSchema):
     id: int
     is_verified: bool
+
+
+class VerifiedCommentsPageSchema(BaseModel):
+    items: List[VerifiedCommentsSchema]
+    next_cursor: Optional[str] = None
+
+
+class CommentsBulkActionSchema(BaseModel):
+    ids: Optional[List[int]] = None
+    user_id: Optional[int] = None
+    only_unverified: bool = False
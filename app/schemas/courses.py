@@ -1,4 +1,5 @@
-from typing import Optional, List
+from enum import Enum
+from typing import Optional, List, Dict
 from datetime import datetime
 from pydantic import BaseModel, ConfigDict
 
@@ -25,6 +26,19 @@ class LevelSchema(BaseModel):
     description: str
 
 
+class CourseFormatReadSchema(BaseModel):
+    id: int
+    name: str
+    model_config = ConfigDict(from_attributes=True)
+
+
+class LevelReadSchema(BaseModel):
+    id: int
+    name: str
+    description: Optional[str] = None
+    model_config = ConfigDict(from_attributes=True)
+
+
 class LevelAdminSchema(BaseModel):
     id: int
     name: str
@@ -130,3 +144,145 @@ class CourseGroupSchema(BaseModel):
     course: GetCourseSchema
 
     model_config = ConfigDict(from_attributes=True)
+
+
+class CourseGroupListSchema(CourseGroupSchema):
+    students_count: int
+    free_places: int
+
+
+class CourseGroupPageSchema(BaseModel):
+    total: int
+    limit: int
+    offset: int
+    items: List[CourseGroupListSchema]
+
+
+class GroupStudentSchema(BaseModel):
+    id: int
+    first_name: str
+    last_name: str
+    email: str
+    model_config = ConfigDict(from_attributes=True)
+
+
+class GroupGradeSchema(BaseModel):
+    id: int
+    user_id: int
+    grade: int
+    comments: Optional[str] = None
+    date_assigned: datetime
+    model_config = ConfigDict(from_attributes=True)
+
+
+class TeacherDashboardGroupSchema(BaseModel):
+    id: int
+    group_name: str
+    course: GetCourseSchema
+    students: List[GroupStudentSchema]
+    students_count: int
+    grades_count: int
+    average_grade: Optional[float] = None
+    latest_grades: List[GroupGradeSchema]
+
+
+class TeacherDashboardSchema(BaseModel):
+    teacher_id: int
+    groups: List[TeacherDashboardGroupSchema]
+
+
+class BriefCourseSchema(BaseModel):
+    id: int
+    name: str
+    model_config = ConfigDict(from_attributes=True)
+
+
+class StudentCourseSchema(BaseModel):
+    id: int
+    name: str
+    group_name: str
+
+
+class StudentCourseRequestSchema(BaseModel):
+    id: int
+    course_id: int
+    status: str
+    is_processed: Optional[bool] = None
+    is_archived: Optional[bool] = None
+    created_at: Optional[datetime] = None
+    course: BriefCourseSchema
+    model_config = ConfigDict(from_attributes=True)
+
+
+class StudentMarkSchema(BaseModel):
+    id: int
+    grade: int
+    comments: Optional[str] = None
+    date_assigned: datetime
+    group_id: int
+    group_name: str
+    course_name: str
+    teacher_first_name: Optional[str] = None
+    teacher_last_name: Optional[str] = None
+    model_config = ConfigDict(from_attributes=True)
+
+
+class StudentMarksPageSchema(BaseModel):
+    items: List[StudentMarkSchema]
+    next_cursor: Optional[str] = None
+
+
+class StudentDashboardSchema(BaseModel):
+    user_id: int
+    courses: List[StudentCourseSchema]
+    requests: List[StudentCourseRequestSchema]
+    marks: StudentMarksPageSchema
+
+
+class BulkGradeItemSchema(BaseModel):
+    user_id: int
+    grade: int
+    comment: Optional[str] = None
+
+
+class BulkGradeSchema(BaseModel):
+    marks: List[BulkGradeItemSchema]
+
+
+class GradebookFormat(str, Enum):
+    json = "json"
+    csv = "csv"
+    xlsx = "xlsx"
+
+
+class GradeStatsScope(str, Enum):
+    student = "student"
+    group = "group"
+    course = "course"
+    teacher = "teacher"
+
+
+class GradeTrendPeriod(str, Enum):
+    week = "week"
+    month = "month"
+    year = "year"
+
+
+class GradeTrendPointSchema(BaseModel):
+    period: datetime
+    count: int
+    average: float
+    cumulative_average: float
+
+
+class GradeStatsSchema(BaseModel):
+    scope: GradeStatsScope
+    scope_id: int
+    count: int
+    average: Optional[float] = None
+    stddev: Optional[float] = None
+    min: Optional[int] = None
+    max: Optional[int] = None
+    percentiles: Dict[str, float]
+    distribution: Dict[int, int]
+    trend: List[GradeTrendPointSchema]
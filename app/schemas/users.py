@@ -1,8 +1,10 @@
 from datetime import datetime
-from typing import Optional
+from typing import Optional, List
 
 from fastapi_users import schemas, models
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, EmailStr, Field
+
+from app.utils.permissions import PermissionName
 
 
 class UserRead(schemas.BaseUser[int]):
@@ -63,3 +65,39 @@ class GetDetailedUserAdminPage(BaseModel):
     registered_at: datetime
     role: Role
     model_config = ConfigDict(from_attributes=True)
+
+
+class UserListItemSchema(BaseModel):
+    id: int
+    username: str
+    email: str
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+    phone_number: Optional[str] = None
+    registered_at: Optional[datetime] = None
+    role_id: Optional[int] = None
+    is_active: bool
+    is_verified: bool
+    is_superuser: bool
+    model_config = ConfigDict(from_attributes=True)
+
+
+class UsersPageSchema(BaseModel):
+    total: int
+    limit: int
+    offset: int
+    items: List[UserListItemSchema]
+
+
+class UserImportRowSchema(BaseModel):
+    email: EmailStr
+    username: str = Field(min_length=1)
+    first_name: str = Field(min_length=1)
+    last_name: str = Field(min_length=1)
+    phone_number: str = Field(min_length=1, max_length=15)
+    password: str = Field(min_length=1)
+    role_id: Optional[int] = None
+
+
+class RolePermissionsSchema(BaseModel):
+    permissions: List[PermissionName]
@@ -1,25 +1,63 @@
+import asyncio
 import datetime
 import logging
+from typing import Optional, List
 
 from fastapi import HTTPException, status
-from fastapi.encoders import jsonable_encoder
 from sqlalchemy.exc import NoResultFound, IntegrityError, SQLAlchemyError
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, delete, insert, update
-from fastapi.responses import JSONResponse
-from sqlalchemy.orm import joinedload, class_mapper, selectinload
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy import select, delete, insert, update, func, Float, Date, Integer, cast, literal, literal_column, \
+    tuple_, or_, any_
+from sqlalchemy.dialects.postgresql import ARRAY
+from fastapi.responses import JSONResponse, Response
+from sqlalchemy.orm import joinedload, selectinload, aliased
 from starlette.status import HTTP_200_OK, HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE
 
 from app.models.courses import Language, Course, CourseLevel, CourseGroup, User, GroupUser, Grade, SchoolComment
-from app.models.courses import CourseFormat, AgeGroup, Level, CourseRequest
+from app.models.courses import CourseFormat, AgeGroup, Level, CourseRequest, GradeStats, RejectedComment
+from app.models.courses import comment_feed_date
 from app.schemas.courses import LanguageSchema, CourseFormatSchema, AgeGroupSchema, LevelSchema, CreateCourseSchema, \
     EditCourseSchema, CourseRequestResponse, EditCourseRequest, LevelAdminSchema, CourseRequestDetailedResponse, \
-    CourseGroupSchema
-from app.schemas.comments import VerifiedCommentsSchema, CommentsSchema
-
-
-def model_to_dict(obj):
-    return {column.name: getattr(obj, column.name) for column in class_mapper(obj.__class__).columns}
+    CourseGroupPageSchema, TeacherDashboardSchema, StudentDashboardSchema, BulkGradeItemSchema, \
+    GradeStatsScope, GradeTrendPeriod, GradeStatsSchema, StudentMarksPageSchema, GetBriedLanguageInfo, \
+    CourseFormatReadSchema, LevelReadSchema, CourseGroupListSchema, GetTeacherSchema, GetCourseSchema
+from app.schemas.comments import CommentsSchema, VerifiedCommentsPageSchema, CommentsBulkActionSchema
+from app.services.users import check_grade
+from app.utils.cache import TTLCache
+from app.utils.grade_stats import grade_stats_upsert, refresh_grade_stats, grade_summary
+from app.utils.pagination import encode_cursor, decode_cursor
+from app.utils.gradebook import build_gradebook
+from app.utils.similarity import SimHashIndex, simhash, to_signed, to_unsigned
+from app.utils.responses import json_response, dump_json
+from app.utils.fields import parse_fields, sparse_load_options, partial_schema, page_schema, column_names
+from app.utils.serializers import json_list
+from app.utils.metrics import register_cache
+
+student_dashboard_cache = TTLCache(ttl=30)
+grade_stats_cache = TTLCache(ttl=300)
+verified_comments_cache = TTLCache(ttl=300)
+register_cache("student_dashboard", student_dashboard_cache)
+register_cache("grade_stats", grade_stats_cache)
+register_cache("verified_comments", verified_comments_cache)
+comment_fingerprints = SimHashIndex()
+
+COURSE_LIST_RELATIONSHIPS = ("format", "levels", "requests", "language")
+
+COMMENT_POSTED = "posted"
+COMMENT_REJECTED = "rejected"
+
+GRADE_PERCENTILES = (0.25, 0.5, 0.75, 0.9)
+GRADE_PERCENTILES_ARRAY = literal_column(f"ARRAY[{', '.join(map(str, GRADE_PERCENTILES))}]")
+
+
+async def group_membership(session: AsyncSession, group_id: int, user_id: int):
+    """(group exists, user exists, user is in the group) in one round trip."""
+    query = await session.execute(select(
+        select(CourseGroup.id).where(CourseGroup.id == group_id).exists(),
+        select(User.id).where(User.id == user_id).exists(),
+        select(GroupUser.id).where(GroupUser.group_id == group_id, GroupUser.user_id == user_id).exists(),
+    ))
+    return query.one()
 
 
 class BaseService:
@@ -68,7 +106,7 @@ class LanguageService:
             statement = select(Language)
             result = await self.session.execute(statement)
             languages = result.scalars().all()
-            return languages
+            return json_list(languages, Language)
         except NoResultFound as e:
             self.logger.error("Noresult " + str(e))
             return None
@@ -84,7 +122,7 @@ class LanguageService:
         new_language = Language(name=language_data.name, rus_name=language_data.rus_name)
         self.session.add(new_language)
         await self.session.commit()
-        return JSONResponse(status_code=status.HTTP_200_OK, content=jsonable_encoder(new_language))
+        return json_response(GetBriedLanguageInfo, new_language)
 
     async def edit_language(self, language_id: int, language_data: LanguageSchema):
         try:
@@ -169,7 +207,7 @@ class CourseFormatService:
         try:
             self.session.add(new_format)
             await self.session.commit()
-            return JSONResponse(status_code=status.HTTP_200_OK, content=jsonable_encoder(new_format))
+            return json_response(CourseFormatReadSchema, new_format)
         except Exception as e:
             self.logger.error(f"Error: {str(e)}")
 
@@ -215,7 +253,7 @@ class CourseFormatService:
             stmt = select(CourseFormat)
             result = await self.session.execute(stmt)
             formats = result.scalars().all()
-            return formats
+            return json_list(formats, CourseFormat)
         except NoResultFound as e:
             self.logger.error("Noresult " + str(e))
             return None
@@ -277,7 +315,7 @@ class AgeGroupService:
             stmt = select(AgeGroup)
             result = await self.session.execute(stmt)
             age_groups = result.scalars().all()
-            return age_groups
+            return json_list(age_groups, AgeGroup)
         except NoResultFound as e:
             self.logger.error("Noresult " + str(e))
             return None
@@ -377,7 +415,7 @@ class LevelService:
         try:
             self.session.add(level)
             await self.session.commit()
-            return JSONResponse(status_code=status.HTTP_200_OK, content=jsonable_encoder(level))
+            return json_response(LevelReadSchema, level)
         except Exception as e:
             self.logger.error(f"Error: {str(e)}")
 
@@ -386,8 +424,7 @@ class LevelService:
             stmt = select(Level)
             result = await self.session.execute(stmt)
             query = result.scalars().all()
-            levels = [LevelAdminSchema.model_validate(item).model_dump() for item in query]
-            return levels
+            return json_response(List[LevelAdminSchema], query)
         except NoResultFound as e:
             self.logger.error('NoResult ' + str(e))
             return None
@@ -517,18 +554,25 @@ class CourseService:
                 detail=f"An error occurred: {str(e)}"
             )
 
-    async def get_courses(self):
+    async def get_courses(self, fields: Optional[str] = None):
+        requested = parse_fields(fields, column_names(Course) + list(COURSE_LIST_RELATIONSHIPS))
         try:
-            statement = select(Course).options(
-                joinedload(Course.format),
-                joinedload(Course.levels),
-                joinedload(Course.requests),
-                joinedload(Course.language)
-            )
+            if requested is None:
+                statement = select(Course).options(
+                    *(joinedload(getattr(Course, name)) for name in COURSE_LIST_RELATIONSHIPS)
+                )
+            else:
+                statement = select(Course).options(
+                    *sparse_load_options(Course, requested),
+                    *(joinedload(getattr(Course, name)) for name in COURSE_LIST_RELATIONSHIPS if name in requested)
+                )
 
             result = await self.session.execute(statement)
             courses = result.unique().scalars().all()
-            return courses
+            if requested is None:
+                return json_list(courses, Course, COURSE_LIST_RELATIONSHIPS)
+            return json_list(courses, Course, [name for name in COURSE_LIST_RELATIONSHIPS if name in requested],
+                             fields=requested)
         except NoResultFound as e:
             self.logger.error("Noresult " + str(e))
             return None
@@ -652,14 +696,16 @@ class CourseRequestService:
         )
         self.session.add(new_request)
         await self.session.commit()
-        return JSONResponse(status_code=HTTP_200_OK,
-                            content=CourseRequestResponse.model_validate(new_request).model_dump())
+        student_dashboard_cache.invalidate(user_id)
+        return json_response(CourseRequestResponse, new_request)
 
     async def delete_course_request(self, course_request_id: int):
         try:
-            stmt = delete(CourseRequest).where(CourseRequest.id == course_request_id)
-            await self.session.execute(stmt)
+            stmt = delete(CourseRequest).where(CourseRequest.id == course_request_id).returning(CourseRequest.user_id)
+            result = await self.session.execute(stmt)
+            user_id = result.scalar_one_or_none()
             await self.session.commit()
+            student_dashboard_cache.invalidate(user_id)
             return JSONResponse(status_code=status.HTTP_200_OK,
                                 content="deleted successfully")
 
@@ -684,15 +730,15 @@ class CourseRequestService:
 
         self.session.add(course_request)
         await self.session.commit()
-        return JSONResponse(status_code=status.HTTP_200_OK,
-                            content=EditCourseRequest.model_validate(course_request).model_dump())
+        student_dashboard_cache.invalidate(course_request.user_id)
+        return json_response(EditCourseRequest, course_request)
 
     async def get_course_requests(self):
         try:
             stmt = select(CourseRequest)
             result = await self.session.execute(stmt)
             requests = result.scalars().all()
-            return requests
+            return json_list(requests, CourseRequest)
 
         except NoResultFound as e:
             self.logger.error("Noresult " + str(e))
@@ -714,8 +760,7 @@ class CourseRequestService:
             )
             query = await self.session.execute(stmt)
             course_request = query.scalars().one()
-            filtered_request = CourseRequestDetailedResponse.model_validate(course_request).model_dump()
-            return filtered_request
+            return json_response(CourseRequestDetailedResponse, course_request)
         except NoResultFound as e:
             self.logger.error(str(e))
             return HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Course request with given id not found")
@@ -745,28 +790,15 @@ class CourseGroupService:
         return new_group
 
     async def add_user_to_group(self, group_id: int, user_id: int):
-        group_exists = await self.session.execute(
-            select(CourseGroup).where(CourseGroup.id == group_id)
-        )
-        user_exists = await self.session.execute(
-            select(User).where(User.id == user_id)
-        )
+        group_found, user_found, is_member = await group_membership(self.session, group_id, user_id)
 
-        group = group_exists.scalar_one_or_none()
-        user = user_exists.scalar_one_or_none()
-
-        if not group or not user:
+        if not group_found or not user_found:
             return JSONResponse(
                 status_code=status.HTTP_404_NOT_FOUND,
                 content="Group or user not found"
             )
 
-        user_in_group = await self.session.execute(
-            select(GroupUser).where(
-                (GroupUser.group_id == group_id) & (GroupUser.user_id == user_id)
-            )
-        )
-        if user_in_group.scalar_one_or_none():
+        if is_member:
             return JSONResponse(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 content="User is already a member of this group"
@@ -776,6 +808,7 @@ class CourseGroupService:
             stmt = insert(GroupUser).values(group_id=group_id, user_id=user_id)
             await self.session.execute(stmt)
             await self.session.commit()
+            student_dashboard_cache.invalidate(user_id)
             return JSONResponse(status_code=status.HTTP_200_OK, content="User added to group successfully")
         except SQLAlchemyError as e:
             await self.session.rollback()
@@ -823,26 +856,79 @@ class CourseGroupService:
                     )
             result = await self.session.execute(stmt)
             users = result.scalars().all()
-            return users
+            return json_list(users, User)
         except Exception as e:
             return JSONResponse(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 content=f"An error occured: {str(e)}")
 
-    async def get_groups(self):
+    async def get_groups(self, course_id: Optional[int] = None, teacher_id: Optional[int] = None,
+                         limit: int = 50, offset: int = 0, fields: Optional[str] = None):
+        requested = parse_fields(fields, CourseGroupListSchema.model_fields)
+        wanted = requested or frozenset(CourseGroupListSchema.model_fields)
+        with_count = bool(wanted & {"students_count", "free_places"})
+        with_course = bool(wanted & {"course", "free_places"})
+
+        options = sparse_load_options(CourseGroup, wanted | ({"course"} if with_course else set()))
+        if "teacher" in wanted:
+            options.append(joinedload(CourseGroup.teacher).load_only(
+                *(getattr(User, name) for name in GetTeacherSchema.model_fields)))
+        if with_course:
+            course_fields = GetCourseSchema.model_fields if "course" in wanted else ["group_size"]
+            options.append(joinedload(CourseGroup.course).load_only(
+                *(getattr(Course, name) for name in course_fields)))
+
+        filters = []
+        if course_id is not None:
+            filters.append(CourseGroup.course_id == course_id)
+        if teacher_id is not None:
+            filters.append(CourseGroup.teacher_id == teacher_id)
+
+        students_count = (
+            select(GroupUser.group_id, func.count(GroupUser.id).label("students_count"))
+            .group_by(GroupUser.group_id)
+            .subquery()
+        )
         try:
-            stmt = select(CourseGroup).options(
-                joinedload(CourseGroup.course),
-                joinedload(CourseGroup.teacher),
-
+            stmt = (
+                select(CourseGroup,
+                       func.coalesce(students_count.c.students_count, 0) if with_count else literal_column("0"),
+                       func.count().over())
+                .where(*filters)
+                .options(*options)
+                .order_by(CourseGroup.id)
+                .limit(limit)
+                .offset(offset)
             )
-
+            if with_count:
+                stmt = stmt.outerjoin(students_count, students_count.c.group_id == CourseGroup.id)
             query = await self.session.execute(stmt)
-            groups = query.scalars().all()
-            filtered_data = [CourseGroupSchema.model_validate(item).model_dump() for item in groups]
-            return filtered_data
-        except Exception as e:
-            print(str(e))
+            rows = query.all()
+
+            if rows:
+                total = rows[0][2]
+            else:
+                count_query = await self.session.execute(
+                    select(func.count(CourseGroup.id)).where(*filters)
+                )
+                total = count_query.scalar_one()
+
+            items = []
+            for group, count, _ in rows:
+                item = {name: getattr(group, name) for name in wanted & {"id", "group_name", "teacher", "course"}}
+                if "students_count" in wanted:
+                    item["students_count"] = count
+                if "free_places" in wanted:
+                    item["free_places"] = max(group.course.group_size - count, 0)
+                items.append(item)
+
+            schema = page_schema(partial_schema(CourseGroupListSchema, requested)) if requested \
+                else CourseGroupPageSchema
+            return json_response(schema, {"total": total, "limit": limit, "offset": offset, "items": items})
+        except SQLAlchemyError as e:
+            self.logger.error(f"error in get_groups: {str(e)}")
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                                detail="An error occurred while loading groups")
 
     async def get_detailed_group(self, group_id: int):
         try:
@@ -859,6 +945,62 @@ class CourseGroupService:
         except Exception as e:
             return HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail='an error occurred')
 
+    async def get_teacher_dashboard(self, teacher_id: int, latest_grades: int = 5):
+        groups_query = await self.session.execute(
+            select(CourseGroup)
+            .where(CourseGroup.teacher_id == teacher_id)
+            .options(
+                joinedload(CourseGroup.course),
+                selectinload(CourseGroup.users)
+            )
+            .order_by(CourseGroup.id)
+        )
+        groups = groups_query.unique().scalars().all()
+
+        grades_by_group = {}
+        if groups:
+            ranked_grades = (
+                select(
+                    Grade.id, Grade.group_id, Grade.user_id, Grade.grade, Grade.comments, Grade.date_assigned,
+                    func.row_number().over(
+                        partition_by=Grade.group_id,
+                        order_by=(Grade.date_assigned.desc(), Grade.id.desc())
+                    ).label("position"),
+                    func.avg(Grade.grade).over(partition_by=Grade.group_id).label("average_grade"),
+                    func.count().over(partition_by=Grade.group_id).label("grades_count"),
+                )
+                .where(Grade.group_id.in_([group.id for group in groups]))
+                .subquery()
+            )
+            grades_query = await self.session.execute(
+                select(ranked_grades)
+                .where(ranked_grades.c.position <= latest_grades)
+                .order_by(ranked_grades.c.group_id, ranked_grades.c.position)
+            )
+            for row in grades_query.mappings():
+                group_grades = grades_by_group.setdefault(row["group_id"], {
+                    "average_grade": float(row["average_grade"]),
+                    "grades_count": row["grades_count"],
+                    "latest_grades": [],
+                })
+                group_grades["latest_grades"].append(row)
+
+        dashboard = {
+            "teacher_id": teacher_id,
+            "groups": [
+                {
+                    "id": group.id,
+                    "group_name": group.group_name,
+                    "course": group.course,
+                    "students": group.users,
+                    "students_count": len(group.users),
+                    **grades_by_group.get(group.id, {"grades_count": 0, "latest_grades": []}),
+                }
+                for group in groups
+            ]
+        }
+        return json_response(TeacherDashboardSchema, dashboard)
+
     async def remove_user_from_group(self, user_id: int, group_id: int):
         stmt = (
             delete(GroupUser)
@@ -872,6 +1014,7 @@ class CourseGroupService:
             raise NoResultFound(f"User {user_id} not found in group {group_id}.")
 
         await self.session.commit()
+        student_dashboard_cache.invalidate(user_id)
         return {"message": f"User {user_id} removed from group {group_id}."}
 
     async def get_teacher_groups(self, teacher_id: int):
@@ -879,7 +1022,7 @@ class CourseGroupService:
             stmt = select(CourseGroup).where(CourseGroup.teacher_id == teacher_id)
             query = await self.session.execute(stmt)
             teacher_groups = query.scalars().all()
-            return teacher_groups
+            return json_list(teacher_groups, CourseGroup)
         except NoResultFound as e:
             self.logger.error(f"error in get_teacher_groups: {str(e)}")
             return HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Group with given ID not found")
@@ -890,46 +1033,69 @@ class CourseGroupService:
 class GradeService:
     def __init__(self, session):
         self.session = session
-
-    async def get_student_marks(self, user_id: int):
+        self.logger = logging.getLogger("GradeService")
+
+    async def get_student_marks(self, user_id: int, limit: int = 50, cursor: Optional[str] = None,
+                                date_from: Optional[datetime.datetime] = None,
+                                date_to: Optional[datetime.datetime] = None, group_id: Optional[int] = None):
+        page = await self.get_student_marks_page(user_id, limit, cursor, date_from, date_to, group_id)
+        return json_response(StudentMarksPageSchema, page)
+
+    async def get_student_marks_page(self, user_id: int, limit: int = 50, cursor: Optional[str] = None,
+                                     date_from: Optional[datetime.datetime] = None,
+                                     date_to: Optional[datetime.datetime] = None, group_id: Optional[int] = None):
+        filters = [Grade.user_id == user_id]
+        if cursor:
+            try:
+                filters.append(tuple_(Grade.date_assigned, Grade.id) < tuple_(*decode_cursor(cursor)))
+            except ValueError as e:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        if date_from is not None:
+            filters.append(Grade.date_assigned >= date_from)
+        if date_to is not None:
+            filters.append(Grade.date_assigned < date_to)
+        if group_id is not None:
+            filters.append(Grade.group_id == group_id)
+
+        teacher = aliased(User)
         grades = await self.session.execute(
-            select(Grade).
-            options(
-                joinedload(Grade.group).joinedload(CourseGroup.course),
-                joinedload(Grade.group).joinedload(CourseGroup.teacher)
-            ).
-            where(Grade.user_id == user_id).
-            order_by(Grade.date_assigned.desc())
+            select(
+                Grade.id, Grade.grade, Grade.comments, Grade.date_assigned, Grade.group_id,
+                CourseGroup.group_name,
+                Course.name.label("course_name"),
+                teacher.first_name.label("teacher_first_name"),
+                teacher.last_name.label("teacher_last_name"),
+            )
+            .join(CourseGroup, CourseGroup.id == Grade.group_id)
+            .join(Course, Course.id == CourseGroup.course_id)
+            .join(teacher, teacher.id == CourseGroup.teacher_id)
+            .where(*filters)
+            .order_by(Grade.date_assigned.desc(), Grade.id.desc())
+            .limit(limit + 1)
         )
-        return grades.scalars().all()
+        rows = grades.mappings().all()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1]["date_assigned"], rows[-1]["id"])
+        return StudentMarksPageSchema(items=rows, next_cursor=next_cursor)
 
     async def add_grade(self, group_id: int, user_id: int, grade: int, comments: str = None):
-        group_exists = await self.session.execute(
-            select(CourseGroup).where(CourseGroup.id == group_id)
-        )
-        group = group_exists.scalar_one_or_none()
-        if not group:
+        group_found, user_found, is_member = await group_membership(self.session, group_id, user_id)
+        if not group_found:
             return JSONResponse(
                 status_code=status.HTTP_404_NOT_FOUND,
                 content="Group not found"
             )
 
-        user_exists = await self.session.execute(
-            select(User).where(User.id == user_id)
-        )
-        user = user_exists.scalar_one_or_none()
-        if not user:
+        if not user_found:
             return JSONResponse(
                 status_code=status.HTTP_404_NOT_FOUND,
                 content="User not found"
             )
 
-        user_in_group = await self.session.execute(
-            select(GroupUser).where(
-                (GroupUser.group_id == group_id) & (GroupUser.user_id == user_id)
-            )
-        )
-        if not user_in_group.scalar_one_or_none():
+        if not is_member:
             return JSONResponse(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 content="User is not a member of this group"
@@ -941,21 +1107,83 @@ class GradeService:
                 user_id=user_id,
                 grade=grade,
                 comments=comments,
-            )
-            await self.session.execute(stmt)
+            ).returning(Grade.group_id, Grade.user_id, Grade.grade, Grade.date_assigned)
+            result = await self.session.execute(stmt)
+            await self.session.execute(grade_stats_upsert(result.all()))
             await self.session.commit()
+            student_dashboard_cache.invalidate(user_id)
+            grade_stats_cache.invalidate_tag(group_id)
             return JSONResponse(
                 status_code=status.HTTP_201_CREATED,
                 content="Grade added successfully"
             )
         except SQLAlchemyError as e:
-            print(str(e))
+            self.logger.error(f"Error while adding grade: {str(e)}")
             await self.session.rollback()
             return JSONResponse(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 content=f"Error while adding grade: {str(e)}"
             )
 
+    async def add_grades(self, group_id: int, marks: List[BulkGradeItemSchema]):
+        if not marks:
+            return JSONResponse(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                content="No marks provided"
+            )
+
+        members_query = await self.session.execute(
+            select(CourseGroup.id, GroupUser.user_id)
+            .outerjoin(GroupUser, (GroupUser.group_id == CourseGroup.id) &
+                       GroupUser.user_id.in_({mark.user_id for mark in marks}))
+            .where(CourseGroup.id == group_id)
+        )
+        rows = members_query.all()
+        if not rows:
+            return JSONResponse(
+                status_code=status.HTTP_404_NOT_FOUND,
+                content="Group not found"
+            )
+        members = {user_id for _, user_id in rows if user_id is not None}
+
+        values, errors = [], []
+        for index, mark in enumerate(marks):
+            if not await check_grade(mark.grade):
+                errors.append({"index": index, "user_id": mark.user_id,
+                               "detail": "Grade must be between 0 and 10"})
+            elif mark.user_id not in members:
+                errors.append({"index": index, "user_id": mark.user_id,
+                               "detail": "User is not a member of this group"})
+            else:
+                values.append({"group_id": group_id, "user_id": mark.user_id,
+                               "grade": mark.grade, "comments": mark.comment})
+
+        created = []
+        if values:
+            try:
+                result = await self.session.execute(
+                    insert(Grade).values(values)
+                    .returning(Grade.id, Grade.group_id, Grade.user_id, Grade.grade, Grade.date_assigned)
+                )
+                rows = result.all()
+                await self.session.execute(grade_stats_upsert([row[1:] for row in rows]))
+                await self.session.commit()
+                created = [{"id": row.id, "user_id": row.user_id} for row in rows]
+            except SQLAlchemyError as e:
+                await self.session.rollback()
+                return JSONResponse(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    content=f"Error while adding grades: {str(e)}"
+                )
+            for user_id in {row["user_id"] for row in created}:
+                student_dashboard_cache.invalidate(user_id)
+            grade_stats_cache.invalidate_tag(group_id)
+
+        return JSONResponse(
+            status_code=status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST,
+            content={"created": created, "errors": errors}
+        )
+
     async def delete_grade(self, grade_id: int):
         grade_exists = await self.session.execute(
             select(Grade).where(Grade.id == grade_id)
@@ -969,7 +1197,11 @@ class GradeService:
 
         try:
             await self.session.delete(grade)
+            await self.session.flush()
+            await refresh_grade_stats(self.session, grade.group_id, grade.user_id)
             await self.session.commit()
+            student_dashboard_cache.invalidate(grade.user_id)
+            grade_stats_cache.invalidate_tag(grade.group_id)
             return JSONResponse(
                 status_code=status.HTTP_200_OK,
                 content="Grade deleted successfully"
@@ -1004,7 +1236,12 @@ class GradeService:
             if comments is not None:
                 existing_grade.comments = comments
 
+            if grade is not None:
+                await self.session.flush()
+                await refresh_grade_stats(self.session, existing_grade.group_id, existing_grade.user_id)
             await self.session.commit()
+            student_dashboard_cache.invalidate(existing_grade.user_id)
+            grade_stats_cache.invalidate_tag(existing_grade.group_id)
             return JSONResponse(
                 status_code=status.HTTP_200_OK,
                 content="Grade updated successfully"
@@ -1016,14 +1253,181 @@ class GradeService:
                 content=f"Error while updating grade: {str(e)}"
             )
 
-    async def get_group_marks(self, group_id: int):
-        stmt = select(Grade).where(Grade.group_id == group_id).options(
+    async def get_grade_summary(self, group_id: int, user_id: int):
+        stats = await self.session.get(GradeStats, (group_id, user_id))
+        if not stats:
+            return {"group_id": group_id, "user_id": user_id, "min": None, "max": None, "last_date": None,
+                    **grade_summary(0, 0, 0)}
+        return {
+            "group_id": group_id,
+            "user_id": user_id,
+            "min": stats.min_grade,
+            "max": stats.max_grade,
+            "last_date": stats.last_date,
+            **grade_summary(stats.grades_count, stats.grades_sum, stats.grades_sum_sq),
+        }
+
+    async def get_gradebook(self, group_id: int, date_from: Optional[datetime.datetime] = None,
+                            date_to: Optional[datetime.datetime] = None):
+        group = await self.session.get(CourseGroup, group_id)
+        if not group:
+            return None
+
+        filters = [Grade.group_id == group_id]
+        if date_from is not None:
+            filters.append(Grade.date_assigned >= date_from)
+        if date_to is not None:
+            filters.append(Grade.date_assigned < date_to)
+
+        members = select(GroupUser.user_id).where(GroupUser.group_id == group_id)
+        graded = select(Grade.user_id).where(*filters)
+        students = await self.session.execute(
+            select(User.id, User.first_name, User.last_name)
+            .where(or_(User.id.in_(members), User.id.in_(graded)))
+            .order_by(User.last_name, User.first_name, User.id)
+        )
+        marks = await self.session.execute(
+            select(Grade.user_id, cast(Grade.date_assigned, Date), Grade.grade)
+            .where(*filters)
+            .order_by(Grade.date_assigned, Grade.id)
+        )
+        return build_gradebook(students.all(), marks.all())
+
+    async def get_group_marks(self, group_id: int, date_from: Optional[datetime.datetime] = None,
+                              date_to: Optional[datetime.datetime] = None):
+        filters = [Grade.group_id == group_id]
+        if date_from is not None:
+            filters.append(Grade.date_assigned >= date_from)
+        if date_to is not None:
+            filters.append(Grade.date_assigned < date_to)
+        stmt = select(Grade).where(*filters).options(
             joinedload(Grade.user)
         )
         query = await self.session.execute(stmt)
         res = query.scalars().all()
-        return res
+        return json_list(res, Grade, ["user"])
+
+
+
+class GradeAnalyticsService:
+    def __init__(self, session: AsyncSession):
+        self.logger = logging.getLogger("GradeAnalyticsService")
+        self.session = session
+
+    def _scoped(self, stmt, scope: GradeStatsScope, scope_id: int):
+        if scope == GradeStatsScope.student:
+            return stmt.where(Grade.user_id == scope_id)
+        if scope == GradeStatsScope.group:
+            return stmt.where(Grade.group_id == scope_id)
+
+        stmt = stmt.join(CourseGroup, CourseGroup.id == Grade.group_id)
+        if scope == GradeStatsScope.course:
+            return stmt.where(CourseGroup.course_id == scope_id)
+        return stmt.where(CourseGroup.teacher_id == scope_id)
+
+    async def get_grade_stats(self, scope: GradeStatsScope, scope_id: int,
+                              period: GradeTrendPeriod = GradeTrendPeriod.month):
+        cache_key = (scope, scope_id, period)
+        stats = grade_stats_cache.get(cache_key)
+        if stats is not None:
+            return Response(content=stats, media_type="application/json")
+
+        summary_query = await self.session.execute(self._scoped(
+            select(
+                func.count(Grade.id),
+                func.avg(Grade.grade),
+                func.stddev_samp(Grade.grade),
+                func.min(Grade.grade),
+                func.max(Grade.grade),
+                func.percentile_cont(GRADE_PERCENTILES_ARRAY).within_group(Grade.grade),
+                func.array_agg(Grade.group_id.distinct()),
+            ).select_from(Grade),
+            scope, scope_id
+        ))
+        count, average, stddev, min_grade, max_grade, percentiles, group_ids = summary_query.one()
+
+        distribution_query = await self.session.execute(self._scoped(
+            select(Grade.grade, func.count(Grade.id))
+            .select_from(Grade)
+            .group_by(Grade.grade)
+            .order_by(Grade.grade),
+            scope, scope_id
+        ))
 
+        # the period is inlined so that the SELECT and GROUP BY expressions are identical
+        period_start = func.date_trunc(literal_column(f"'{period.value}'"), Grade.date_assigned).label("period")
+        trend_query = await self.session.execute(self._scoped(
+            select(
+                period_start,
+                func.count(Grade.id),
+                cast(func.avg(Grade.grade), Float),
+                cast(func.sum(func.sum(Grade.grade)).over(order_by=period_start) /
+                     func.sum(func.count(Grade.id)).over(order_by=period_start), Float),
+            )
+            .select_from(Grade)
+            .group_by(period_start)
+            .order_by(period_start),
+            scope, scope_id
+        ))
+
+        stats = dump_json(GradeStatsSchema, GradeStatsSchema(
+            scope=scope,
+            scope_id=scope_id,
+            count=count,
+            average=average,
+            stddev=stddev,
+            min=min_grade,
+            max=max_grade,
+            percentiles={f"p{round(q * 100)}": value
+                         for q, value in zip(GRADE_PERCENTILES, percentiles or ())},
+            distribution=dict(distribution_query.all()),
+            trend=[
+                {"period": point, "count": point_count, "average": point_average,
+                 "cumulative_average": cumulative_average}
+                for point, point_count, point_average, cumulative_average in trend_query.all()
+            ],
+        ))
+
+        tags = set(group_ids or ())
+        if scope == GradeStatsScope.group:
+            tags.add(scope_id)
+        grade_stats_cache.set(cache_key, stats, tags=tags)
+        return Response(content=stats, media_type="application/json")
+
+
+class StudentDashboardService:
+    def __init__(self, session_maker: async_sessionmaker):
+        self.logger = logging.getLogger("StudentDashboardService")
+        self.session_maker = session_maker
+
+    async def get_dashboard(self, user_id: int):
+        dashboard = student_dashboard_cache.get(user_id)
+        if dashboard is not None:
+            return Response(content=dashboard, media_type="application/json")
+
+        courses, requests, marks = await asyncio.gather(
+            self._get_courses(user_id),
+            self._get_requests(user_id),
+            self._get_marks(user_id),
+        )
+        dashboard = dump_json(
+            StudentDashboardSchema,
+            {"user_id": user_id, "courses": courses, "requests": requests, "marks": marks},
+        )
+        student_dashboard_cache.set(user_id, dashboard)
+        return Response(content=dashboard, media_type="application/json")
+
+    async def _get_courses(self, user_id: int):
+        async with self.session_maker() as session:
+            return await CourseService(session).get_user_courses(user_id)
+
+    async def _get_requests(self, user_id: int):
+        async with self.session_maker() as session:
+            return await CourseRequestService(session).get_user_requests(user_id)
+
+    async def _get_marks(self, user_id: int):
+        async with self.session_maker() as session:
+            return await GradeService(session).get_student_marks_page(user_id, limit=20)
 
 
 class SchoolCommentsService:
@@ -1038,13 +1442,32 @@ class SchoolCommentsService:
                 content="Comment cannot be empty"
             )
 
+        fingerprint = simhash(comment)
+        if fingerprint is not None:
+            statuses = {match_status for _, match_status, _ in comment_fingerprints.find_near(fingerprint)}
+            if COMMENT_REJECTED in statuses:
+                self.logger.info(f"comment from user {user_id} rejected as a near-duplicate of a rejected one")
+                return JSONResponse(
+                    status_code=status.HTTP_409_CONFLICT,
+                    content="This comment is too similar to a previously rejected comment"
+                )
+            if COMMENT_POSTED in statuses:
+                return JSONResponse(
+                    status_code=status.HTTP_409_CONFLICT,
+                    content="A very similar comment has already been posted"
+                )
+
         try:
             stmt = insert(SchoolComment).values(
                 user_id=user_id,
                 comment=comment,
-            )
-            await self.session.execute(stmt)
+                fingerprint=to_signed(fingerprint) if fingerprint is not None else None,
+            ).returning(SchoolComment.id)
+            result = await self.session.execute(stmt)
+            comment_id = result.scalar_one()
             await self.session.commit()
+            if fingerprint is not None:
+                comment_fingerprints.add(("comment", comment_id), fingerprint, COMMENT_POSTED)
             return JSONResponse(
                 status_code=status.HTTP_201_CREATED,
                 content="Comment added successfully"
@@ -1061,6 +1484,7 @@ class SchoolCommentsService:
             stmt = update(SchoolComment).where(SchoolComment.id == comment_id).values(is_verified=True)
             await self.session.execute(stmt)
             await self.session.commit()
+            verified_comments_cache.clear()
             return JSONResponse(
                 status_code=status.HTTP_201_CREATED,
                 content="Comment is verified"
@@ -1073,11 +1497,18 @@ class SchoolCommentsService:
 
     async def delete_comment(self, comment_id: int):
         try:
-            stmt = await self.session.execute(select(SchoolComment).where(SchoolComment.id == comment_id))
-            comment = stmt.scalars().one()
+            result = await self.session.execute(
+                delete(SchoolComment).where(SchoolComment.id == comment_id)
+                .returning(SchoolComment.id, SchoolComment.fingerprint)
+            )
+            deleted = result.all()
+            if not deleted:
+                raise NoResultFound(f"Comment {comment_id} not found.")
 
-            await self.session.delete(comment)
+            rejected = await self._reject_fingerprints(deleted)
             await self.session.commit()
+            verified_comments_cache.clear()
+            self._forget_comments(deleted, rejected)
             return JSONResponse(
                 status_code=status.HTTP_200_OK,
                 content="Comment deleted successfully")
@@ -1093,22 +1524,147 @@ class SchoolCommentsService:
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 content=f"Error while deleting comment: {str(e)}")
 
-    async def get_verified_comments(self):
-        stmt = select(SchoolComment).where(SchoolComment.is_verified == True).options(
-            joinedload(SchoolComment.user)
+    async def load_fingerprints(self):
+        """Only stored fingerprints are loaded; comments that predate the column get theirs from
+        python -m app.utils.comment_fingerprints backfill."""
+        comments = await self.session.execute(
+            select(SchoolComment.id, SchoolComment.fingerprint).where(SchoolComment.fingerprint.isnot(None))
+        )
+        rejected = await self.session.execute(select(RejectedComment.id, RejectedComment.fingerprint))
+
+        comment_fingerprints.clear()
+        for comment_id, fingerprint in comments.all():
+            comment_fingerprints.add(("comment", comment_id), to_unsigned(fingerprint), COMMENT_POSTED)
+        for rejected_id, fingerprint in rejected.all():
+            comment_fingerprints.add(("rejected", rejected_id), to_unsigned(fingerprint), COMMENT_REJECTED)
+        self.logger.info(f"loaded {len(comment_fingerprints)} comment fingerprints")
+
+    async def _reject_fingerprints(self, deleted_rows):
+        values = [{"fingerprint": fingerprint} for _, fingerprint in deleted_rows if fingerprint is not None]
+        if not values:
+            return []
+        result = await self.session.execute(
+            insert(RejectedComment).values(values).returning(RejectedComment.id, RejectedComment.fingerprint)
         )
+        return result.all()
+
+    def _forget_comments(self, deleted_rows, rejected_rows):
+        for comment_id, _ in deleted_rows:
+            comment_fingerprints.remove(("comment", comment_id))
+        for rejected_id, fingerprint in rejected_rows:
+            comment_fingerprints.add(("rejected", rejected_id), to_unsigned(fingerprint), COMMENT_REJECTED)
+
+    def _bulk_filters(self, data: CommentsBulkActionSchema):
+        filters = []
+        if data.ids is not None:
+            filters.append(SchoolComment.id == any_(literal(data.ids, ARRAY(Integer))))
+        if data.user_id is not None:
+            filters.append(SchoolComment.user_id == data.user_id)
+        if data.only_unverified:
+            filters.append(SchoolComment.is_verified == False)
+        return filters
+
+    async def verify_comments(self, data: CommentsBulkActionSchema):
+        if data.ids is None and data.user_id is None:
+            return JSONResponse(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                content="Specify comment ids or a user id"
+            )
+        try:
+            stmt = (
+                update(SchoolComment)
+                .where(*self._bulk_filters(data))
+                .values(is_verified=True)
+                .returning(SchoolComment.id)
+                .execution_options(synchronize_session=False)
+            )
+            result = await self.session.execute(stmt)
+            verified = result.scalars().all()
+            await self.session.commit()
+            verified_comments_cache.clear()
+            return JSONResponse(status_code=status.HTTP_200_OK, content={"verified": verified})
+        except SQLAlchemyError as e:
+            await self.session.rollback()
+            return JSONResponse(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                content=f"Error while verifying comments: {str(e)}"
+            )
 
-        query = await self.session.execute(stmt)
-        comments = query.scalars().all()
+    async def delete_comments(self, data: CommentsBulkActionSchema):
+        if data.ids is None and data.user_id is None:
+            return JSONResponse(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                content="Specify comment ids or a user id"
+            )
+        try:
+            stmt = (
+                delete(SchoolComment)
+                .where(*self._bulk_filters(data))
+                .returning(SchoolComment.id, SchoolComment.fingerprint)
+                .execution_options(synchronize_session=False)
+            )
+            result = await self.session.execute(stmt)
+            deleted = result.all()
+            rejected = await self._reject_fingerprints(deleted)
+            await self.session.commit()
+            verified_comments_cache.clear()
+            self._forget_comments(deleted, rejected)
+            return JSONResponse(status_code=status.HTTP_200_OK,
+                                content={"deleted": [comment_id for comment_id, _ in deleted]})
+        except SQLAlchemyError as e:
+            await self.session.rollback()
+            return JSONResponse(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                content=f"Error while deleting comments: {str(e)}"
+            )
+
+    async def get_verified_comments(self, limit: int = 20, cursor: Optional[str] = None):
+        if cursor is None:
+            cached_page = verified_comments_cache.get(limit)
+            if cached_page is not None:
+                return Response(content=cached_page, media_type="application/json")
 
-        filtered_query = [VerifiedCommentsSchema.model_validate(comment).model_dump() for comment in comments]
-        return filtered_query
+        filters = [SchoolComment.is_verified == True]
+        if cursor:
+            try:
+                # asyncpg maps datetime.min, the cursor of an undated row, back to -infinity
+                filters.append(tuple_(comment_feed_date, SchoolComment.id) < tuple_(*decode_cursor(cursor)))
+            except ValueError as e:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+        stmt = (
+            select(SchoolComment.id, SchoolComment.comment, SchoolComment.date_added,
+                   comment_feed_date.label("feed_date"), User.first_name, User.last_name)
+            .join(User, User.id == SchoolComment.user_id)
+            .where(*filters)
+            .order_by(comment_feed_date.desc(), SchoolComment.id.desc())
+            .limit(limit + 1)
+        )
+        query = await self.session.execute(stmt)
+        rows = query.all()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1].feed_date, rows[-1].id)
+        page = dump_json(VerifiedCommentsPageSchema, {
+            "items": [
+                {"comment": row.comment, "date_added": row.date_added,
+                 "user": {"first_name": row.first_name, "last_name": row.last_name}}
+                for row in rows
+            ],
+            "next_cursor": next_cursor,
+        })
+
+        if cursor is None:
+            verified_comments_cache.set(limit, page)
+        return Response(content=page, media_type="application/json")
 
     async def get_unverified_comments(self):
         stmt = select(SchoolComment).where(SchoolComment.is_verified == False)
         query = await self.session.execute(stmt)
         comments = query.scalars().all()
-        return comments
+        return json_list(comments, SchoolComment)
 
     async def get_all_comments(self):
         stmt = select(SchoolComment).options(
@@ -1116,5 +1672,4 @@ class SchoolCommentsService:
         )
         query = await self.session.execute(stmt)
         comments = query.scalars().all()
-        filtered_comments = [CommentsSchema.model_validate(comment).model_dump() for comment in comments]
-        return filtered_comments
+        return json_response(List[CommentsSchema], comments)
@@ -1,16 +1,37 @@
+import csv
+import io
 import logging
 import re
+from datetime import datetime
+from typing import Optional, List
 
 from fastapi import HTTPException, status
 from sqlalchemy.exc import NoResultFound, IntegrityError, SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update, delete
+from sqlalchemy import select, update, delete, func, or_
 from fastapi.responses import JSONResponse
+from pydantic import ValidationError
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import joinedload
 
 from app.models.courses import User, Role
 
-from app.schemas.users import GetDetailedUserAdminPage, UserUpdate
+from app.schemas.users import GetDetailedUserAdminPage, UserUpdate, UserListItemSchema, UsersPageSchema, \
+    UserImportRowSchema
+from app.utils.hashing import password_hashing_pool
+from app.utils.permissions import Permission, role_permissions, permission_names, compile_permissions
+from app.utils.responses import json_response
+from app.utils.fields import parse_fields, partial_schema, page_schema
+from app.utils.serializers import json_list
+IMPORT_INSERT_CHUNK = 1000
+
+USER_LIST_COLUMNS = [getattr(User, field) for field in UserListItemSchema.model_fields]
+SEARCH_COLUMNS = (User.first_name, User.last_name, User.email, User.phone_number)
+
+
+def _like_pattern(term: str) -> str:
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
 
 
 class UserServiceAdmin:
@@ -28,8 +49,7 @@ class UserServiceAdmin:
             )
             result = await self.session.execute(stmt)
             user_query = result.scalars().one()
-            user = GetDetailedUserAdminPage.model_validate(user_query).model_dump()
-            return user
+            return json_response(GetDetailedUserAdminPage, user_query)
         except NoResultFound as e:
             self.logger.error(str(e))
             return HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User with given id not found")
@@ -38,6 +58,53 @@ class UserServiceAdmin:
             return HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                                  detail="An unexpected error occurred")
 
+    async def get_users(self, search: Optional[str] = None, role_id: Optional[int] = None,
+                        is_active: Optional[bool] = None, is_verified: Optional[bool] = None,
+                        registered_from: Optional[datetime] = None, registered_to: Optional[datetime] = None,
+                        limit: int = 50, offset: int = 0, fields: Optional[str] = None):
+        requested = parse_fields(fields, UserListItemSchema.model_fields)
+        columns = USER_LIST_COLUMNS if requested is None else [column for column in USER_LIST_COLUMNS
+                                                               if column.key in requested]
+        filters = []
+        if role_id is not None:
+            filters.append(User.role_id == role_id)
+        if is_active is not None:
+            filters.append(User.is_active == is_active)
+        if is_verified is not None:
+            filters.append(User.is_verified == is_verified)
+        if registered_from is not None:
+            filters.append(User.registered_at >= registered_from)
+        if registered_to is not None:
+            filters.append(User.registered_at < registered_to)
+        # every word has to match one of the columns, so "anna ivanova" finds first + last name
+        for term in (search or "").split():
+            pattern = _like_pattern(term)
+            filters.append(or_(*(column.ilike(pattern) for column in SEARCH_COLUMNS)))
+
+        try:
+            stmt = (
+                select(*columns, func.count().over().label("total"))
+                .where(*filters)
+                .order_by(User.registered_at.desc(), User.id.desc())
+                .limit(limit)
+                .offset(offset)
+            )
+            query = await self.session.execute(stmt)
+            rows = query.all()
+
+            if rows:
+                total = rows[0].total
+            else:
+                count_query = await self.session.execute(select(func.count(User.id)).where(*filters))
+                total = count_query.scalar_one()
+
+            schema = page_schema(partial_schema(UserListItemSchema, requested)) if requested else UsersPageSchema
+            return json_response(schema, {"total": total, "limit": limit, "offset": offset, "items": rows})
+        except SQLAlchemyError as e:
+            self.logger.error(f"error in get_users: {str(e)}")
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                                detail="An error occurred while loading users")
+
     async def update_user(self, user_id: int, user_update: UserUpdate):
         update_data = user_update.model_dump(exclude_unset=True)
         stmt = (
@@ -66,7 +133,25 @@ class UserServiceAdmin:
         stmt = select(Role)
         query = await self.session.execute(stmt)
         roles = query.scalars().all()
-        return roles
+        return json_list(roles, Role)
+
+    async def edit_role_permissions(self, role_id: int, permissions: List[str]):
+        names = permission_names(compile_permissions(permissions))
+        try:
+            result = await self.session.execute(
+                update(Role).where(Role.id == role_id).values(permissions=names).returning(Role.id)
+            )
+            if result.scalar_one_or_none() is None:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Role not found")
+            await self.session.commit()
+        except SQLAlchemyError as e:
+            self.logger.error(f"error in edit_role_permissions: {str(e)}")
+            await self.session.rollback()
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                                detail="An error occurred while updating role permissions")
+
+        role_permissions.set_role(role_id, names)
+        return JSONResponse(status_code=status.HTTP_200_OK, content={"id": role_id, "permissions": names})
 
     async def edit_user_role(self, user_id: int, role_id: int):
         try:
@@ -119,11 +204,112 @@ class UserServiceAdmin:
             return JSONResponse(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, content="An Error occured")
 
     async def get_teachers(self):
-        stmt = select(User).where(User.role_id == 3)
+        stmt = select(User).where(User.role_id.in_(role_permissions.role_ids_with(Permission.TEACH)))
         query = await self.session.execute(stmt)
         teachers = query.scalars().all()
-        return teachers
+        return json_list(teachers, User)
+
+
+
+def parse_users_csv(content: bytes):
+    """Yields (line number, row dict) pairs; the first line must be a header with UserImportRowSchema fields."""
+    reader = csv.DictReader(io.StringIO(content.decode("utf-8-sig")))
+    for row in reader:
+        yield reader.line_num, {key.strip(): (value or "").strip() for key, value in row.items() if key}
+
+
+class UserImportService:
+    def __init__(self, session: AsyncSession):
+        self.logger = logging.getLogger("UserImportService")
+        self.session = session
 
+    async def _validate_rows(self, rows):
+        valid, errors = [], []
+        seen_emails, seen_phones = set(), set()
+        for line, row in rows:
+            try:
+                user = UserImportRowSchema.model_validate({key: value for key, value in row.items() if value != ""})
+            except ValidationError as e:
+                errors.append({"row": line, "error": "; ".join(
+                    f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors()
+                )})
+                continue
+            email = user.email.lower()
+            if not await email_validator(email):
+                errors.append({"row": line, "error": "email: address is not accepted"})
+            elif email in seen_emails:
+                errors.append({"row": line, "error": "email: duplicated in the file"})
+            elif user.phone_number in seen_phones:
+                errors.append({"row": line, "error": "phone_number: duplicated in the file"})
+            else:
+                seen_emails.add(email)
+                seen_phones.add(user.phone_number)
+                valid.append((line, user))
+        return valid, errors
+
+    async def _existing(self, users: List[UserImportRowSchema]):
+        query = await self.session.execute(
+            select(func.lower(User.email), User.phone_number).where(or_(
+                func.lower(User.email).in_([user.email.lower() for user in users]),
+                User.phone_number.in_([user.phone_number for user in users]),
+            ))
+        )
+        rows = query.all()
+        return {email for email, _ in rows}, {phone for _, phone in rows}
+
+    async def import_users(self, rows):
+        valid, errors = await self._validate_rows(rows)
+        created = 0
+        if not valid:
+            return {"created": created, "errors": errors}
+
+        try:
+            emails, phones = await self._existing([user for _, user in valid])
+            candidates = []
+            for line, user in valid:
+                if user.email.lower() in emails:
+                    errors.append({"row": line, "error": "email: user already exists"})
+                elif user.phone_number in phones:
+                    errors.append({"row": line, "error": "phone_number: user already exists"})
+                else:
+                    candidates.append((line, user))
+
+            hashed = await password_hashing_pool.hash_many([user.password for _, user in candidates])
+            values = [
+                {
+                    **user.model_dump(exclude={"password", "role_id"}),
+                    "email": user.email.lower(),
+                    "role_id": user.role_id or role_permissions.default_role_id(),
+                    "hashed_password": hashed_password,
+                }
+                for (_, user), hashed_password in zip(candidates, hashed)
+            ]
+
+            inserted = set()
+            for start in range(0, len(values), IMPORT_INSERT_CHUNK):
+                # rows that lost a race with a concurrent registration are skipped, not fatal
+                stmt = (
+                    insert(User)
+                    .values(values[start:start + IMPORT_INSERT_CHUNK])
+                    .on_conflict_do_nothing()
+                    .returning(User.email)
+                )
+                result = await self.session.execute(stmt)
+                inserted.update(result.scalars().all())
+            await self.session.commit()
+        except SQLAlchemyError as e:
+            self.logger.error(f"error in import_users: {str(e)}")
+            await self.session.rollback()
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                                detail="An error occurred while importing users")
+
+        for (line, user), row in zip(candidates, values):
+            if row["email"] in inserted:
+                created += 1
+            else:
+                errors.append({"row": line, "error": "user already exists"})
+        self.logger.info(f"imported {created} users, {len(errors)} rows rejected")
+        return {"created": created, "errors": sorted(errors, key=lambda error: error["row"])}
 
 async def email_validator(email: str) -> bool:
     email_regex = r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$"
@@ -0,0 +1,144 @@
+import os
+
+# read when app.utils.query_guard is imported, so it has to be set before anything imports the app
+os.environ["APP_ENV"] = "test"
+
+import pytest
+import pytest_asyncio
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app.config.auth import get_jwt_strategy
+from app.database import get_async_session
+from app.main import app
+from app.models.courses import Base, User, Language, CourseFormat, AgeGroup, Course, CourseGroup, GroupUser, \
+    SchoolComment
+from app.services.courses import student_dashboard_cache, grade_stats_cache, verified_comments_cache, \
+    comment_fingerprints
+from app.utils.grade_partitions import ensure_grade_partitions
+from app.utils.query_guard import budget_violations, install_query_guard
+from app.utils.timing import install_query_timing
+
+# e.g. postgresql+asyncpg://postgres@localhost:5433/school_test; the database is wiped by the tests
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+# NullPool: every test runs on its own event loop and asyncpg connections can't move between loops
+test_engine = create_async_engine(TEST_DATABASE_URL, poolclass=NullPool) if TEST_DATABASE_URL else None
+if test_engine is not None:
+    install_query_guard(test_engine)
+    install_query_timing(test_engine)
+    test_session_maker = async_sessionmaker(test_engine, expire_on_commit=False)
+
+
+@pytest.fixture(autouse=True)
+def no_query_budget_violations():
+    budget_violations.clear()
+    yield
+    assert not budget_violations, "\n\n".join(budget_violations)
+
+
+_schema_created = False
+
+
+@pytest_asyncio.fixture
+async def db():
+    """A freshly truncated test database, with the app's sessions pointed at it."""
+    global _schema_created
+    if test_engine is None:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    async with test_engine.begin() as conn:
+        if not _schema_created:
+            await conn.run_sync(Base.metadata.drop_all)
+            await conn.run_sync(Base.metadata.create_all)
+            await ensure_grade_partitions(conn)
+            _schema_created = True
+        tables = ", ".join(f'"{table.name}"' for table in Base.metadata.sorted_tables)
+        await conn.execute(text(f"TRUNCATE {tables} RESTART IDENTITY CASCADE"))
+        await conn.execute(text("INSERT INTO role (id, name) VALUES (1, 'admin'), (2, 'student'), (3, 'teacher')"))
+    for cache in (student_dashboard_cache, grade_stats_cache, verified_comments_cache):
+        cache.clear()
+    comment_fingerprints.clear()
+
+    async def get_test_session():
+        async with test_session_maker() as session:
+            yield session
+
+    app.dependency_overrides[get_async_session] = get_test_session
+    try:
+        async with test_session_maker() as session:
+            yield session
+    finally:
+        app.dependency_overrides.pop(get_async_session, None)
+
+
+@pytest_asyncio.fixture
+async def api(db):
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+
+
+def query_count(response) -> int:
+    """Statements the request ran, read back from its Server-Timing header."""
+    for part in response.headers["Server-Timing"].split(", "):
+        if part.startswith("db;"):
+            return int(part.split('desc="')[1].split(" ")[0])
+    raise AssertionError("no db entry in Server-Timing")
+
+
+class Factory:
+    def __init__(self, session):
+        self.session = session
+        self._count = 0
+
+    def _next(self) -> int:
+        self._count += 1
+        return self._count
+
+    async def add(self, obj):
+        self.session.add(obj)
+        await self.session.commit()
+        return obj
+
+    async def user(self, role_id: int = 2, is_superuser: bool = False, **fields) -> User:
+        n = self._next()
+        return await self.add(User(email=f"user{n}@school.org", username=f"user{n}", first_name=f"First{n}",
+                                   last_name=f"Last{n}", hashed_password="x", role_id=role_id,
+                                   is_superuser=is_superuser, is_verified=True, **fields))
+
+    async def teacher(self) -> User:
+        return await self.user(role_id=3)
+
+    async def admin(self) -> User:
+        return await self.user(role_id=1, is_superuser=True)
+
+    async def course(self) -> Course:
+        n = self._next()
+        language = await self.add(Language(name=f"Language {n}", rus_name=f"Язык {n}"))
+        course_format = await self.add(CourseFormat(name=f"Format {n}"))
+        age_group = await self.add(AgeGroup(name=f"Age group {n}", min_age=10, max_age=99))
+        return await self.add(Course(name=f"Course {n}", description="-", group_size=10, intensity="normal",
+                                     price=100, language_id=language.id, format_id=course_format.id,
+                                     age_group_id=age_group.id))
+
+    async def group(self, teacher: User, course: Course = None, students=()) -> CourseGroup:
+        course = course or await self.course()
+        group = await self.add(CourseGroup(course_id=course.id, group_name=f"Group {self._next()}",
+                                           teacher_id=teacher.id))
+        for student in students:
+            await self.add(GroupUser(group_id=group.id, user_id=student.id))
+        return group
+
+    async def comment(self, user: User, **fields) -> SchoolComment:
+        return await self.add(SchoolComment(user_id=user.id, comment=fields.pop("comment", "Great school"),
+                                            **fields))
+
+    @staticmethod
+    async def auth(user: User) -> dict:
+        return {"Authorization": f"Bearer {await get_jwt_strategy().write_token(user)}"}
+
+
+@pytest_asyncio.fixture
+async def factory(db):
+    return Factory(db)
@@ -1,9 +1,48 @@
+from datetime import datetime, date
+
 import httpx
 import pytest
 from app.services.users import email_validator
 from fastapi.testclient import TestClient
 from app.main import app
-from app.services.users import check_grade
+from app.services.users import check_grade, _like_pattern, parse_users_csv
+from app.utils.cache import TTLCache
+from app.utils.grade_stats import grade_summary, aggregate_grades
+from app.utils.pagination import encode_cursor, decode_cursor
+from app.utils.gradebook import build_gradebook, iter_gradebook_csv
+from app.utils.grade_partitions import academic_year, partition_name, partition_bounds
+from app.utils.similarity import SimHashIndex, simhash, to_signed, to_unsigned
+from app.utils.permissions import Permission, PermissionRegistry, compile_permissions
+from app.utils.auth_manager import violated_constraint, EMAIL_UNIQUE_INDEX
+from sqlalchemy.exc import IntegrityError
+from app.utils.responses import dump_json, type_adapter
+from app.utils.fields import parse_fields, partial_schema, sparse_load_options
+from app.models.courses import Course, Grade, User
+from app.utils.serializers import serialize, serializer_for
+from app.utils.timing import RequestTimings
+from app.test.conftest import query_count, test_engine
+from app.utils.grade_partitions import backfill_grade_partitions, detach_grade_partition
+from app.utils.grade_stats import rebuild_grade_stats
+from app.models.courses import GradeStats, SchoolComment, Level, CourseLevel
+from app.utils.query_guard import QueryBudgetExceeded, count_queries, install_query_guard, route_budget
+from fastapi.routing import APIRoute
+from sqlalchemy import create_engine, select, text, update
+from app.services.courses import SchoolCommentsService, comment_fingerprints
+from app.utils.comment_fingerprints import backfill_comment_fingerprints
+from app.utils.hashing import PasswordHashingPool
+from fastapi_users.password import PasswordHelper
+from app.utils.metrics import MetricsRegistry
+from app.utils.slow_queries import SlowQueryLog, install_slow_query_log, is_read_only, redact_parameters
+from app.utils.timing import request_timings
+from app.utils.profiling import ProfileStore, profile_requested
+from app.utils.log_config import ContextQueueHandler, JsonFormatter, request_id, start_logging, stop_logging
+import io
+import json
+import logging
+import queue
+from fastapi import HTTPException
+from app.schemas.courses import LevelAdminSchema
+from typing import List
 
 
 @pytest.mark.asyncio
@@ -80,3 +119,712 @@ async def test_check_grade_invalid_types():
     assert await check_grade(None) is False
     assert await check_grade([5]) is False
     assert await check_grade({"grade": 5}) is False
+
+
+def test_ttl_cache_returns_value_until_expired(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("app.utils.cache.time.monotonic", lambda: now[0])
+    cache = TTLCache(ttl=30)
+    cache.set(1, {"courses": []})
+
+    assert cache.get(1) == {"courses": []}
+    now[0] += 30
+    assert cache.get(1) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_ttl_cache_invalidate_and_evict_oldest():
+    cache = TTLCache(ttl=30, maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.set("c", 3)
+
+    assert cache.get("a") is None
+    assert cache.get("c") == 3
+    cache.invalidate("c")
+    assert cache.get("c") is None
+
+
+def test_ttl_cache_invalidate_tag():
+    cache = TTLCache(ttl=30)
+    cache.set(("group", 1), "group stats", tags=[1])
+    cache.set(("student", 7), "student stats", tags=[1, 2])
+    cache.set(("student", 8), "other stats", tags=[2])
+
+    cache.invalidate_tag(1)
+
+    assert cache.get(("group", 1)) is None
+    assert cache.get(("student", 7)) is None
+    assert cache.get(("student", 8)) == "other stats"
+
+
+def test_ttl_cache_forgets_tags_of_removed_keys():
+    cache = TTLCache(ttl=30, maxsize=2)
+    cache.set("a", 1, tags=["group:1"])
+    cache.set("b", 2, tags=["group:1", "student:7"])
+    cache.invalidate("a")
+    cache.set("c", 3, tags=["group:2"])
+    cache.set("d", 4)  # evicts "b"
+    cache.invalidate_tag("group:2")
+    assert cache._tags == {} and cache._key_tags == {}
+
+    expiring = TTLCache(ttl=0)
+    expiring.set("a", 1, tags=["group:1"])
+    assert expiring.get("a") is None
+    assert expiring._tags == {} and expiring._key_tags == {}
+
+
+def test_grade_summary_from_rollup_sums():
+    summary = grade_summary(count=4, total=28, total_sq=202)
+
+    assert summary["average"] == 7
+    assert summary["variance"] == pytest.approx(2.0)
+    assert summary["stddev"] == pytest.approx(2.0 ** 0.5)
+    assert grade_summary(0, 0, 0)["average"] is None
+    assert grade_summary(1, 9, 81)["variance"] == 0.0
+
+
+def test_aggregate_grades_folds_rows_per_group_and_user():
+    rows = [
+        (1, 5, 8, datetime(2024, 9, 1)),
+        (1, 5, 6, datetime(2024, 9, 3)),
+        (2, 5, 10, datetime(2024, 9, 2)),
+    ]
+
+    stats = {(row["group_id"], row["user_id"]): row for row in aggregate_grades(rows)}
+
+    assert stats[(1, 5)] == {
+        "group_id": 1, "user_id": 5, "grades_count": 2, "grades_sum": 14, "grades_sum_sq": 100,
+        "min_grade": 6, "max_grade": 8, "last_date": datetime(2024, 9, 3),
+    }
+    assert stats[(2, 5)]["grades_count"] == 1
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor(datetime(2024, 9, 1, 10, 30), 42)
+
+    assert decode_cursor(cursor) == (datetime(2024, 9, 1, 10, 30), 42)
+
+
+@pytest.mark.parametrize("cursor", ["", "not-a-cursor", "WyJ4Il0="])
+def test_decode_cursor_rejects_garbage(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_build_gradebook_pivots_marks_by_student_and_day():
+    students = [(1, "Anna", "Ivanova"), (2, "Petr", "Petrov")]
+    marks = [(1, date(2024, 9, 1), 8), (1, date(2024, 9, 1), 9), (2, date(2024, 9, 3), 5), (3, date(2024, 9, 3), 7)]
+
+    gradebook = build_gradebook(students, marks)
+
+    assert gradebook["dates"] == [date(2024, 9, 1), date(2024, 9, 3)]
+    assert gradebook["marks"] == [[[8, 9], []], [[], [5]]]
+    assert [student["average"] for student in gradebook["students"]] == [8.5, 5.0]
+
+
+def test_gradebook_csv_export():
+    gradebook = build_gradebook([(1, "Anna", "Ivanova")], [(1, date(2024, 9, 1), 8), (1, date(2024, 9, 1), 9)])
+
+    lines = "".join(iter_gradebook_csv(gradebook)).splitlines()
+
+    assert lines == ["id,first_name,last_name,2024-09-01,average", "1,Anna,Ivanova,8 9,8.5"]
+
+
+@pytest.mark.parametrize("day, expected", [
+    (date(2024, 9, 1), 2024),
+    (date(2024, 12, 31), 2024),
+    (date(2025, 8, 31), 2024),
+])
+def test_academic_year_partitions(day, expected):
+    assert academic_year(day) == expected
+    assert partition_name(expected) == f"grade_{expected}_{expected + 1}"
+    start, end = partition_bounds(expected)
+    assert start <= day < end
+
+
+def test_simhash_index_finds_near_duplicates():
+    spam = "Buy cheap essays online at www.best-essays.example, discount 50% today only for students!"
+    index = SimHashIndex()
+    index.add(("comment", 1), simhash(spam), "posted")
+
+    near = index.find_near(simhash("buy cheap essays online at www.best-essays.example discount 60% today only for students"))
+    unrelated = index.find_near(simhash("My daughter loves the conversation club, the teachers are very patient."))
+
+    assert [key for key, _, _ in near] == [("comment", 1)]
+    assert unrelated == []
+    assert simhash("Great school!") is None
+    assert to_unsigned(to_signed(simhash(spam))) == simhash(spam)
+
+
+def test_user_search_pattern_escapes_wildcards():
+    assert _like_pattern("anna") == "%anna%"
+    assert _like_pattern("50%_off") == "%50\\%\\_off%"
+
+
+def test_parse_users_csv():
+    content = "\ufeffemail, username ,phone_number\nanna@school.org, anna ,+7900111\n".encode()
+
+    assert list(parse_users_csv(content)) == [
+        (2, {"email": "anna@school.org", "username": "anna", "phone_number": "+7900111"})
+    ]
+
+
+def test_compile_permissions():
+    assert compile_permissions(["study", "TEACH", "unknown"]) == Permission.STUDY | Permission.TEACH
+    assert compile_permissions({"moderate_comments": True, "teach": False}) == Permission.MODERATE_COMMENTS
+    assert compile_permissions(None) == Permission(0)
+
+
+def test_permission_registry():
+    registry = PermissionRegistry()
+    registry.load([(1, ["manage_users", "manage_courses"]), (2, None), (3, None), (5, ["study"])])
+
+    assert registry.has(3, Permission.TEACH)
+    assert not registry.has(2, Permission.TEACH)
+    assert not registry.has(1, Permission.MANAGE_USERS | Permission.TEACH)
+    assert registry.role_ids_with(Permission.STUDY) == [2, 5]
+    assert registry.default_role_id() == 2
+
+    registry.set_role(3, ["teach", "moderate_comments"])
+    assert registry.has(3, Permission.TEACH | Permission.MODERATE_COMMENTS)
+
+
+def test_violated_constraint_reads_driver_error():
+    class UniqueViolation(Exception):
+        constraint_name = EMAIL_UNIQUE_INDEX
+
+    driver_error = Exception("duplicate key value violates unique constraint")
+    driver_error.__cause__ = UniqueViolation()
+
+    assert violated_constraint(IntegrityError("INSERT", {}, driver_error)) == EMAIL_UNIQUE_INDEX
+    assert violated_constraint(IntegrityError("INSERT", {}, Exception())) is None
+
+
+def test_dump_json_from_orm_like_objects():
+    class Level:
+        def __init__(self, id, name):
+            self.id, self.name = id, name
+
+    assert dump_json(List[LevelAdminSchema], [Level(1, "A1"), {"id": 2, "name": "B2"}]) == \
+        b'[{"id":1,"name":"A1"},{"id":2,"name":"B2"}]'
+    assert type_adapter(List[LevelAdminSchema]) is type_adapter(List[LevelAdminSchema])
+
+
+def test_parse_fields():
+    assert parse_fields(None, ["id", "name"]) is None
+    assert parse_fields(" id, name ,", ["id", "name"]) == {"id", "name"}
+    with pytest.raises(HTTPException):
+        parse_fields("id,hashed_password", ["id", "name"])
+
+
+def test_partial_schema_keeps_only_requested_fields():
+    schema = partial_schema(LevelAdminSchema, frozenset({"name"}))
+
+    assert list(schema.model_fields) == ["name"]
+    assert schema is partial_schema(LevelAdminSchema, frozenset({"name"}))
+    assert len(sparse_load_options(Course, {"name", "language"})) == 1 + 4
+
+
+def test_model_serializer_hides_password_and_follows_relationships():
+    grade = Grade(id=5, user_id=1, group_id=2, grade=9, date_assigned=datetime(2024, 9, 1))
+    grade.user = User(id=1, email="anna@school.org", username="anna", hashed_password="secret")
+
+    row, = serialize([grade], Grade, ["user"])
+
+    assert row["grade"] == 9
+    assert row["user"]["email"] == "anna@school.org"
+    assert "hashed_password" not in row["user"]
+    assert serializer_for(Grade, frozenset({"grade"})).to_dict(grade) == {"grade": 9}
+    assert serializer_for(Grade, frozenset({"user"})).to_dict(grade) == {}
+
+
+def test_request_timings_breakdown():
+    timings = RequestTimings()
+    timings.started = 0.0
+    timings.route_started = 0.001
+    timings.endpoint_started = 0.011
+    timings.serialize_time = 0.002
+    timings.endpoint_finished = 0.031
+    timings.route_finished = 0.034
+    timings.db_time, timings.db_count = 0.015, 3
+
+    breakdown = timings.breakdown(finished=0.035)
+
+    assert breakdown == {"total": 35.0, "db": 15.0, "deps": 10.0, "handler": 18.0, "serialize": 5.0}
+    assert 'db;dur=15.0;desc="3 queries"' in timings.server_timing(breakdown)
+
+
+def test_every_route_declares_query_budget():
+    routes = [route for route in app.routes
+              if isinstance(route, APIRoute) and route.endpoint.__module__.startswith("app.routers.")]
+    assert routes
+    assert [route.path for route in routes if route_budget(route) is None] == []
+
+
+def test_query_counter_reports_repeats_and_budget():
+    engine = create_engine("sqlite://")
+    install_query_guard(engine)
+    with count_queries() as counter, engine.connect() as conn:
+        for i in range(3):
+            conn.execute(text("SELECT :i"), {"i": i})
+        conn.execute(text("SELECT 1"))
+
+    assert counter.count == 4
+    assert counter.repeated() == {"SELECT ?": 3}
+    counter.check(4)
+    with pytest.raises(QueryBudgetExceeded):
+        counter.check(3, "GET /levels")
+
+
+def test_metrics_registry_renders_prometheus_text():
+    registry = MetricsRegistry()
+    requests = registry.counter("requests_total", "Requests", ("route", "status"))
+    latency = registry.histogram("latency_seconds", "Latency", ("route",), buckets=(0.1, 1.0))
+    registry.gauge("queue_depth", "Queue depth", lambda: [((), 7)])
+    requests.inc("/levels", 200)
+    requests.inc("/levels", 200)
+    latency.observe(0.05, "/levels")
+    latency.observe(0.5, "/levels")
+    latency.observe(3, "/levels")
+
+    lines = registry.render().splitlines()
+
+    assert "# TYPE requests_total counter" in lines
+    assert 'requests_total{route="/levels",status="200"} 2' in lines
+    assert 'latency_seconds_bucket{route="/levels",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{route="/levels",le="1.0"} 2' in lines
+    assert 'latency_seconds_bucket{route="/levels",le="+Inf"} 3' in lines
+    assert 'latency_seconds_count{route="/levels"} 3' in lines
+    assert "queue_depth 7" in lines
+    with pytest.raises(ValueError):
+        registry.counter("requests_total", "Requests")
+
+
+def test_slow_query_log_records_statement_route_and_parameters():
+    engine = create_engine("sqlite://")
+    log = SlowQueryLog(threshold_ms=0, explain_sample_rate=0, maxlen=2)
+    install_slow_query_log(engine, log)
+    timings = RequestTimings()
+    timings.route = "GET /levels"
+    token = request_timings.set(timings)
+    try:
+        with engine.connect() as conn:
+            for i in range(3):
+                conn.execute(text("SELECT :i"), {"i": i})
+    finally:
+        request_timings.reset(token)
+
+    recent = log.recent()
+    assert [entry["parameters"] for entry in recent] == ["(2,)", "(1,)"]
+    assert recent[0]["statement"] == "SELECT ?"
+    assert recent[0]["route"] == "GET /levels"
+    assert recent[0]["plan"] is None
+    assert redact_parameters('INSERT INTO "user" (email, hashed_password) VALUES ($1, $2), ($3, $4)',
+                             ("anna@school.org", "$2b$12$hash", "ivan@school.org", None)) == \
+        ("str", "str", "str", "NoneType")
+    assert redact_parameters("SELECT * FROM grade WHERE group_id = $1", (7,)) == (7,)
+    assert is_read_only(" with x as (select 1) select * from x")
+    assert not is_read_only("UPDATE grades SET grade = 1")
+
+
+@pytest.mark.parametrize("headers, query_string, expected", [
+    ([], b"", False),
+    ([(b"x-profile", b"1")], b"", True),
+    ([(b"x-profile", b"0")], b"profile=1", False),
+    ([], b"limit=10&profile=true", True),
+    ([], b"profile=0", False),
+    ([], b"profiles=1", False),
+])
+def test_profile_requested(headers, query_string, expected):
+    assert profile_requested({"headers": headers, "query_string": query_string}) == expected
+
+
+def test_profile_store_keeps_latest_profiles():
+    store = ProfileStore(maxlen=2)
+    for profile_id in ("a", "b", "c"):
+        store.add(profile_id, "text/plain", profile_id * 3)
+    assert store.get("a") is None
+    assert store.get("c") == ("text/plain", "ccc")
+
+
+def test_queued_log_records_render_as_json_with_request_id():
+    log_queue = queue.SimpleQueue()
+    logger = logging.getLogger("test.log_config")
+    logger.propagate = False
+    logger.addHandler(ContextQueueHandler(log_queue))
+    token = request_id.set("req-1")
+    try:
+        try:
+            1 / 0
+        except ZeroDivisionError:
+            logger.exception("grade %s failed", 7, extra={"group_id": 3})
+    finally:
+        request_id.reset(token)
+        logger.handlers.clear()
+
+    entry = json.loads(JsonFormatter().format(log_queue.get_nowait()))
+
+    assert entry["message"] == "grade 7 failed"
+    assert entry["request_id"] == "req-1"
+    assert entry["level"] == "ERROR"
+    assert entry["group_id"] == 3
+    assert "ZeroDivisionError" in entry["exception"]
+
+
+def test_start_logging_routes_uvicorn_loggers_through_the_queue():
+    access = logging.getLogger("uvicorn.access")
+    uvicorn_handler = logging.StreamHandler(io.StringIO())
+    access.handlers[:] = [uvicorn_handler]
+    access.propagate = False
+    access.setLevel(logging.INFO)
+    root_level = logging.getLogger().level
+    output = io.StringIO()
+    start_logging("INFO", stream=output)
+    try:
+        assert access.handlers == [] and access.propagate
+        access.info('%s - "%s %s HTTP/%s" %d', "127.0.0.1:5000", "GET", "/levels", "1.1", 200)
+    finally:
+        stop_logging()
+        logging.getLogger().setLevel(root_level)
+
+    entry = json.loads(output.getvalue().splitlines()[-1])
+    assert entry["logger"] == "uvicorn.access"
+    assert entry["message"] == '127.0.0.1:5000 - "GET /levels HTTP/1.1" 200'
+    assert access.handlers == [uvicorn_handler] and not access.propagate
+    access.handlers.clear()
+    access.propagate = True
+
+
+@pytest.mark.asyncio
+async def test_add_user_to_group_stays_within_budget(api, factory):
+    admin, teacher, student = await factory.admin(), await factory.teacher(), await factory.user()
+    group = await factory.group(teacher)
+
+    response = await api.post(f"/courses/add_user_to_group/{group.id}/{student.id}", headers=await factory.auth(admin))
+    assert response.status_code == 200
+    # auth, membership check, insert
+    assert query_count(response) == 3
+
+    response = await api.post(f"/courses/add_user_to_group/{group.id}/{student.id}", headers=await factory.auth(admin))
+    assert response.status_code == 400
+    assert query_count(response) == 2
+
+
+@pytest.mark.asyncio
+async def test_add_grade_stays_within_budget(api, factory):
+    admin, teacher, student = await factory.admin(), await factory.teacher(), await factory.user()
+    group = await factory.group(teacher, students=[student])
+
+    response = await api.post(f"/courses/add_mark/{student.id}/{group.id}", params={"grade": 8},
+                              headers=await factory.auth(admin))
+    assert response.status_code == 201
+    # auth, membership check, insert, grade_stats upsert
+    assert query_count(response) == 4
+
+
+async def _two_groups_with_a_grade(api, factory):
+    admin, owner, other, student = await factory.admin(), await factory.teacher(), await factory.teacher(), \
+        await factory.user()
+    group = await factory.group(owner, students=[student])
+    await factory.group(other)
+    response = await api.post(f"/courses/add_mark/{student.id}/{group.id}", params={"grade": 7},
+                              headers=await factory.auth(admin))
+    assert response.status_code == 201
+    marks = await api.get(f"/courses/get_group_marks/{group.id}", headers=await factory.auth(admin))
+    grade_id = marks.json()[0]["id"]
+    return owner, other, student, group, grade_id
+
+
+def _mark_requests(student, group, grade_id):
+    return [
+        ("post", f"/courses/add_mark/{student.id}/{group.id}", {"params": {"grade": 5}}),
+        ("post", f"/courses/add_marks/{group.id}", {"json": {"marks": [{"user_id": student.id, "grade": 6}]}}),
+        ("patch", f"/courses/edit_mark/{grade_id}", {"params": {"grade": 9}}),
+        ("get", f"/courses/get_group_marks/{group.id}", {}),
+        ("get", f"/courses/get_group_gradebook/{group.id}", {}),
+        ("delete", f"/courses/delete_mark/{grade_id}", {}),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_teacher_cannot_manage_marks_of_another_group(api, factory):
+    owner, other, student, group, grade_id = await _two_groups_with_a_grade(api, factory)
+    headers = await factory.auth(other)
+
+    for method, url, kwargs in _mark_requests(student, group, grade_id):
+        response = await api.request(method.upper(), url, headers=headers, **kwargs)
+        assert response.status_code == 403, (url, response.text)
+
+
+@pytest.mark.asyncio
+async def test_teacher_manages_marks_of_own_group(api, factory):
+    owner, other, student, group, grade_id = await _two_groups_with_a_grade(api, factory)
+    headers = await factory.auth(owner)
+
+    for method, url, kwargs in _mark_requests(student, group, grade_id):
+        response = await api.request(method.upper(), url, headers=headers, **kwargs)
+        assert response.status_code in (200, 201), (url, response.text)
+
+
+@pytest.mark.asyncio
+async def test_students_cannot_manage_marks(api, factory):
+    owner, other, student, group, grade_id = await _two_groups_with_a_grade(api, factory)
+
+    response = await api.get(f"/courses/get_group_marks/{group.id}", headers=await factory.auth(student))
+    assert response.status_code == 403
+
+
+@pytest.mark.asyncio
+async def test_add_marks_reports_invalid_rows_and_inserts_the_rest(api, factory):
+    teacher, student, outsider = await factory.teacher(), await factory.user(), await factory.user()
+    group = await factory.group(teacher, students=[student])
+    marks = [
+        {"user_id": student.id, "grade": 9, "comment": "good"},
+        {"user_id": outsider.id, "grade": 5},
+        {"user_id": 999999, "grade": 5},
+        {"user_id": student.id, "grade": 11},
+        {"user_id": student.id, "grade": 4},
+    ]
+
+    response = await api.post(f"/courses/add_marks/{group.id}", json={"marks": marks},
+                              headers=await factory.auth(teacher))
+
+    assert response.status_code == 201
+    body = response.json()
+    assert [row["user_id"] for row in body["created"]] == [student.id, student.id]
+    assert [(error["index"], error["detail"]) for error in body["errors"]] == [
+        (1, "User is not a member of this group"),
+        (2, "User is not a member of this group"),
+        (3, "Grade must be between 0 and 10"),
+    ]
+    summary = await api.get(f"/courses/get_grade_summary/{group.id}/{student.id}",
+                            headers=await factory.auth(await factory.admin()))
+    assert summary.json()["count"] == 2
+
+
+@pytest.mark.asyncio
+async def test_add_marks_with_only_invalid_rows_inserts_nothing(api, factory):
+    teacher, outsider = await factory.teacher(), await factory.user()
+    group = await factory.group(teacher)
+    headers = await factory.auth(teacher)
+
+    response = await api.post(f"/courses/add_marks/{group.id}", json={"marks": [{"user_id": outsider.id, "grade": 5}]},
+                              headers=headers)
+    assert response.status_code == 400
+    assert response.json()["created"] == []
+    assert len(response.json()["errors"]) == 1
+
+    response = await api.post(f"/courses/add_marks/{group.id}", json={"marks": []}, headers=headers)
+    assert response.status_code == 400
+    response = await api.post("/courses/add_marks/999999", json={"marks": [{"user_id": outsider.id, "grade": 5}]},
+                              headers=await factory.auth(await factory.admin()))
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_get_groups_filters_and_paginates(api, factory):
+    admin, first_teacher, second_teacher = await factory.admin(), await factory.teacher(), await factory.teacher()
+    students = [await factory.user() for _ in range(3)]
+    course = await factory.course()
+    groups = [
+        await factory.group(first_teacher, course, students=students),
+        await factory.group(first_teacher, course),
+        await factory.group(second_teacher, course, students=students[:1]),
+        await factory.group(second_teacher),
+    ]
+    headers = await factory.auth(admin)
+
+    page = (await api.get("/courses/get_groups", params={"course_id": course.id, "limit": 2},
+                          headers=headers)).json()
+    assert (page["total"], page["limit"], page["offset"]) == (3, 2, 0)
+    assert [item["id"] for item in page["items"]] == [groups[0].id, groups[1].id]
+    assert page["items"][0]["students_count"] == 3
+    assert page["items"][0]["free_places"] == course.group_size - 3
+
+    page = (await api.get("/courses/get_groups", params={"course_id": course.id, "limit": 2, "offset": 2},
+                          headers=headers)).json()
+    assert page["total"] == 3
+    assert [(item["id"], item["students_count"]) for item in page["items"]] == [(groups[2].id, 1)]
+
+    page = (await api.get("/courses/get_groups", params={"teacher_id": second_teacher.id}, headers=headers)).json()
+    assert [item["id"] for item in page["items"]] == [groups[2].id, groups[3].id]
+
+    page = (await api.get("/courses/get_groups", params={"teacher_id": second_teacher.id, "offset": 10},
+                          headers=headers)).json()
+    assert (page["total"], page["items"]) == (2, [])
+
+
+@pytest.mark.asyncio
+async def test_bulk_comment_actions_reject_an_empty_filter(api, factory):
+    admin, author = await factory.admin(), await factory.user()
+    await factory.comment(author)
+    headers = await factory.auth(admin)
+
+    for url in ("/comments/verify_comments", "/comments/delete_comments"):
+        for body in ({}, {"only_unverified": True}):
+            response = await api.post(url, json=body, headers=headers)
+            assert response.status_code == 400, (url, body)
+    response = await api.get("/comments/get_unverified_comments", headers=headers)
+    assert len(response.json()) == 1
+
+
+@pytest.mark.asyncio
+async def test_bulk_comment_actions_apply_only_to_matching_comments(api, factory):
+    admin, author, other = await factory.admin(), await factory.user(), await factory.user()
+    first = await factory.comment(author, comment="Teachers are friendly and lessons are fun")
+    second = await factory.comment(author, comment="The schedule suits me well", is_verified=True)
+    third = await factory.comment(author, comment="Could use more speaking practice")
+    foreign = await factory.comment(other, comment="Nice building near the metro station")
+    headers = await factory.auth(admin)
+
+    response = await api.post("/comments/verify_comments", json={"ids": [first.id, foreign.id]}, headers=headers)
+    assert sorted(response.json()["verified"]) == [first.id, foreign.id]
+
+    response = await api.post("/comments/delete_comments", json={"user_id": author.id, "only_unverified": True},
+                              headers=headers)
+    assert response.json()["deleted"] == [third.id]
+
+    remaining = await api.get("/comments/get_all_comments", headers=headers)
+    assert sorted(comment["id"] for comment in remaining.json()) == [first.id, second.id, foreign.id]
+
+
+@pytest.mark.asyncio
+async def test_backfill_moves_old_grades_out_of_default_partition_and_detach_refreshes_stats(db, factory):
+    teacher, student = await factory.teacher(), await factory.user()
+    group = await factory.group(teacher, students=[student])
+    far_future = datetime(academic_year(date.today()) + 6, 10, 1)
+    for grade, assigned in ((8, datetime(2019, 10, 1)), (2, datetime(2019, 11, 1)), (6, datetime(2020, 10, 1)),
+                            (10, datetime.utcnow()), (9, far_future)):
+        db.add(Grade(group_id=group.id, user_id=student.id, grade=grade, date_assigned=assigned))
+    await rebuild_grade_stats(db)
+    await db.commit()
+    key = (group.id, student.id)
+
+    try:
+        async with test_engine.begin() as conn:
+            created = await backfill_grade_partitions(conn)
+        assert {"grade_2019_2020", "grade_2020_2021"} <= set(created)
+        async with test_engine.connect() as conn:
+            partitions = dict((await conn.execute(text(
+                "SELECT grade, tableoid::regclass::text FROM grade"
+            ))).all())
+        assert partitions[8] == partitions[2] == "grade_2019_2020"
+        assert partitions[6] == "grade_2020_2021"
+        assert partitions[9] == "grade_default"
+
+        async with test_engine.begin() as conn:
+            await detach_grade_partition(conn, 2019)
+        db.expire_all()
+        stats = await db.get(GradeStats, key)
+        assert (stats.grades_count, stats.grades_sum, stats.min_grade) == (3, 25, 6)
+    finally:
+        async with test_engine.begin() as conn:
+            await conn.execute(text("DROP TABLE IF EXISTS grade_2019_2020"))
+
+
+@pytest.mark.asyncio
+async def test_verified_comments_feed_pages_through_undated_comments(api, factory):
+    author = await factory.user()
+    legacy = [await factory.comment(author, comment=f"Legacy comment {i} without a date", is_verified=True)
+              for i in range(2)]
+    # the column default fills in an explicit None on insert, so the NULLs are written afterwards
+    await factory.session.execute(update(SchoolComment).where(SchoolComment.id.in_([c.id for c in legacy]))
+                                  .values(date_added=None))
+    await factory.session.commit()
+    older = await factory.comment(author, comment="Lessons are well organised", is_verified=True,
+                                  date_added=datetime(2024, 1, 1))
+    newer = await factory.comment(author, comment="Friendly teachers and small groups", is_verified=True,
+                                  date_added=datetime(2024, 2, 1))
+
+    pages, cursor = [], None
+    for _ in range(5):
+        params = {"limit": 1} if cursor is None else {"limit": 1, "cursor": cursor}
+        response = await api.get("/comments/get_verified_comments", params=params)
+        assert response.status_code == 200
+        pages.append([(item["comment"], item["date_added"]) for item in response.json()["items"]])
+        cursor = response.json()["next_cursor"]
+        if cursor is None:
+            break
+
+    assert pages == [[(newer.comment, "2024-02-01T00:00:00")], [(older.comment, "2024-01-01T00:00:00")],
+                     [(legacy[1].comment, None)], [(legacy[0].comment, None)]]
+
+
+@pytest.mark.asyncio
+async def test_slow_query_plan_capture_is_not_charged_to_the_request(db, caplog):
+    log = SlowQueryLog(threshold_ms=0, explain_sample_rate=1)
+    timings = RequestTimings()
+    timings.route = "GET /levels"
+    token = request_timings.set(timings)
+    try:
+        with count_queries() as counter:
+            entry = log.record("SELECT count(*) FROM school_comments", (), 250.0)
+            with caplog.at_level(logging.INFO, logger="app.slow_queries"):
+                log.schedule_explain(test_engine, entry, ())
+                await log._capture_task
+    finally:
+        request_timings.reset(token)
+
+    assert entry.plan.startswith("Aggregate")
+    assert counter.count == 0
+    assert timings.db_count == 0
+    captured = [record for record in caplog.records if getattr(record, "slow_query_id", None) == entry.id]
+    assert captured and captured[0].plan == entry.plan and captured[0].route == "GET /levels"
+
+
+@pytest.mark.asyncio
+async def test_get_courses_with_only_relationship_fields(api, factory):
+    course = await factory.course()
+    level = await factory.add(Level(name="A1"))
+    await factory.add(CourseLevel(course_id=course.id, level_id=level.id, level_type="start"))
+
+    response = await api.get("/courses/get_courses", params={"fields": "levels"})
+
+    assert response.status_code == 200
+    assert response.json() == [{"levels": [{"id": 1, "course_id": course.id, "level_id": level.id,
+                                            "level_type": "start"}]}]
+
+
+@pytest.mark.asyncio
+async def test_slow_query_on_users_keeps_only_parameter_types(db):
+    log = SlowQueryLog(threshold_ms=0, explain_sample_rate=1)
+    statement = 'SELECT "user".id FROM "user" WHERE "user".email = $1::VARCHAR'
+    entry = log.record(statement, ("anna@school.org",), 250.0)
+    log.schedule_explain(test_engine, entry, ("anna@school.org",))
+    await log._capture_task
+
+    assert log.recent()[0]["parameters"] == "('str',)"
+    assert "'***'" in entry.plan and "anna@school.org" not in entry.plan
+
+
+@pytest.mark.asyncio
+async def test_comment_fingerprint_backfill_stores_legacy_fingerprints(factory):
+    author = await factory.user()
+    legacy = [await factory.comment(author, comment=f"Legacy comment number {i} about the evening courses")
+              for i in range(3)]
+    short = await factory.comment(author, comment="Nice")
+
+    assert await backfill_comment_fingerprints(factory.session, batch_size=2) == 3
+
+    result = await factory.session.execute(select(SchoolComment.id, SchoolComment.fingerprint)
+                                           .order_by(SchoolComment.id))
+    stored = dict(result.all())
+    assert stored == {**{comment.id: to_signed(simhash(comment.comment)) for comment in legacy}, short.id: None}
+    assert await backfill_comment_fingerprints(factory.session) == 0
+
+    await SchoolCommentsService(factory.session).load_fingerprints()
+    assert len(comment_fingerprints) == 3
+
+
+@pytest.mark.asyncio
+async def test_password_hashing_pool_does_not_fork_the_app_process():
+    pool = PasswordHashingPool(max_workers=1)
+    try:
+        hashed = await pool.hash_many(["correct horse", "battery staple"])
+        assert pool._get_executor()._mp_context.get_start_method() in ("forkserver", "spawn")
+    finally:
+        pool.shutdown()
+
+    assert PasswordHelper().verify_and_update("battery staple", hashed[1])[0]
+    assert pool.pending == 0
@@ -1,12 +1,25 @@
+import logging
 from typing import Optional
 
 from fastapi import Depends, Request
 from fastapi_users import BaseUserManager, IntegerIDMixin, schemas, models, exceptions
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
 
 from app.models.courses import User
+from app.utils.permissions import role_permissions
 from app.utils.users import get_user_db
 
 SECRET = "SECRET"
+EMAIL_UNIQUE_INDEX = "uq_user_email_lower"
+
+logger = logging.getLogger("UserManager")
+
+
+def violated_constraint(error: IntegrityError) -> Optional[str]:
+    # asyncpg keeps the constraint (or unique index) name on the original driver exception
+    cause = getattr(error.orig, "__cause__", None)
+    return getattr(cause, "constraint_name", None) or getattr(error.orig, "constraint_name", None)
 
 
 class UserManager(IntegerIDMixin, BaseUserManager[User, int]):
@@ -14,7 +27,7 @@ class UserManager(IntegerIDMixin, BaseUserManager[User, int]):
     verification_token_secret = SECRET
 
     async def on_after_register(self, user: User, request: Optional[Request] = None):
-        print(f"User {user.id} has registered.")
+        logger.info(f"User {user.id} has registered.")
 
     async def create(
             self,
@@ -37,10 +50,6 @@ class UserManager(IntegerIDMixin, BaseUserManager[User, int]):
         """
         await self.validate_password(user_create.password, user_create)
 
-        existing_user = await self.user_db.get_by_email(user_create.email)
-        if existing_user is not None:
-            raise exceptions.UserAlreadyExists()
-
         user_dict = (
             user_create.create_update_dict()
             if safe
@@ -48,9 +57,19 @@ class UserManager(IntegerIDMixin, BaseUserManager[User, int]):
         )
         password = user_dict.pop("password")
         user_dict["hashed_password"] = self.password_helper.hash(password)
-        user_dict['role_id'] = 2
-
-        created_user = await self.user_db.create(user_dict)
+        user_dict['role_id'] = role_permissions.default_role_id()
+
+        # no lookup beforehand: the unique index on lower(email) rejects duplicates, even concurrent ones
+        session = self.user_db.session
+        try:
+            result = await session.execute(insert(User).values(**user_dict).returning(User))
+            created_user = result.scalar_one()
+            await session.commit()
+        except IntegrityError as e:
+            await session.rollback()
+            if violated_constraint(e) == EMAIL_UNIQUE_INDEX:
+                raise exceptions.UserAlreadyExists()
+            raise
 
         await self.on_after_register(created_user, request)
 
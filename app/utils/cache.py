@@ -0,0 +1,63 @@
+import time
+
+
+class TTLCache:
+    def __init__(self, ttl: float, maxsize: int = 1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = {}
+        self._tags = {}  # tag -> keys
+        self._key_tags = {}  # key -> tags, so a removed key can be dropped from its tag sets
+
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, value, tags=()):
+        if key not in self._data and len(self._data) >= self.maxsize:
+            self._evict()
+        self._remove(key)
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        if tags:
+            self._key_tags[key] = tuple(tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+
+    def invalidate(self, key):
+        self._remove(key)
+
+    def invalidate_tag(self, tag):
+        for key in list(self._tags.get(tag, ())):
+            self._remove(key)
+
+    def clear(self):
+        self._data.clear()
+        self._tags.clear()
+        self._key_tags.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def _evict(self):
+        now = time.monotonic()
+        for key in [key for key, (expires_at, _) in self._data.items() if expires_at <= now]:
+            self._remove(key)
+        if len(self._data) >= self.maxsize:
+            # dicts keep insertion order, so the first key is the oldest entry
+            self._remove(next(iter(self._data)))
+
+    def _remove(self, key):
+        self._data.pop(key, None)
+        for tag in self._key_tags.pop(key, ()):
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
@@ -0,0 +1,51 @@
+import argparse
+import asyncio
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.courses import SchoolComment
+from app.utils.similarity import simhash, to_signed
+
+
+async def backfill_comment_fingerprints(session: AsyncSession, batch_size: int = 1000) -> int:
+    """Computes and stores the fingerprints of comments written before the column existed, one committed batch
+    at a time. Comments too short to fingerprint stay NULL. Returns the number of comments updated."""
+    updated = 0
+    last_id = 0
+    while True:
+        result = await session.execute(
+            select(SchoolComment.id, SchoolComment.comment)
+            .where(SchoolComment.fingerprint.is_(None), SchoolComment.id > last_id)
+            .order_by(SchoolComment.id)
+            .limit(batch_size)
+        )
+        rows = result.all()
+        if not rows:
+            return updated
+        last_id = rows[-1].id
+        values = []
+        for comment_id, comment in rows:
+            fingerprint = simhash(comment)
+            if fingerprint is not None:
+                values.append({"id": comment_id, "fingerprint": to_signed(fingerprint)})
+        if values:
+            await session.execute(update(SchoolComment), values)
+            await session.commit()
+            updated += len(values)
+
+
+async def main():
+    from app.database import async_session_maker
+
+    async with async_session_maker() as session:
+        updated = await backfill_comment_fingerprints(session)
+    print(f"{updated} comment fingerprints stored")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Store SimHash fingerprints of comments that have none.")
+    parser.add_argument("command", choices=["backfill"])
+    parser.parse_args()
+    raise SystemExit(asyncio.run(main()))
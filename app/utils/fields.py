@@ -0,0 +1,60 @@
+from functools import lru_cache
+from typing import FrozenSet, Iterable, List, Optional, Type
+
+from fastapi import HTTPException, status
+from pydantic import BaseModel, ConfigDict, create_model
+from sqlalchemy import inspect
+from sqlalchemy.orm import load_only, noload
+
+
+def parse_fields(fields: Optional[str], allowed: Iterable[str]) -> Optional[FrozenSet[str]]:
+    """Parses a ?fields=id,name parameter; None means the client wants every field."""
+    if not fields:
+        return None
+    requested = frozenset(name.strip() for name in fields.split(",") if name.strip())
+    unknown = requested - set(allowed)
+    if unknown:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    return requested or None
+
+
+def column_names(model) -> List[str]:
+    return [column.key for column in inspect(model).column_attrs]
+
+
+def relationship_names(model) -> List[str]:
+    return [relationship.key for relationship in inspect(model).relationships]
+
+
+def sparse_load_options(model, fields: Iterable[str]) -> list:
+    """load_only() for the requested columns (the primary key is always kept) and noload() for
+    relationships that weren't asked for; eager loading of the requested relationships is up to the caller."""
+    fields = set(fields)
+    mapper = inspect(model)
+    primary_key = {column.key for column in mapper.primary_key}
+    columns = [getattr(model, name) for name in column_names(model) if name in fields or name in primary_key]
+    options = [load_only(*columns, raiseload=True)]
+    options.extend(noload(getattr(model, name)) for name in relationship_names(model) if name not in fields)
+    return options
+
+
+@lru_cache(maxsize=None)
+def partial_schema(schema: Type[BaseModel], fields: FrozenSet[str]) -> Type[BaseModel]:
+    """A copy of schema restricted to fields, built once per field set."""
+    return create_model(
+        f"{schema.__name__}Partial",
+        __config__=ConfigDict(from_attributes=True),
+        **{name: (field.annotation, field) for name, field in schema.model_fields.items() if name in fields},
+    )
+
+
+@lru_cache(maxsize=None)
+def page_schema(item_schema: Type[BaseModel]) -> Type[BaseModel]:
+    return create_model(
+        f"{item_schema.__name__}Page",
+        total=(int, ...),
+        limit=(int, ...),
+        offset=(int, ...),
+        items=(List[item_schema], ...),
+    )
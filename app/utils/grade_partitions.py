@@ -0,0 +1,128 @@
+import argparse
+import asyncio
+from datetime import date
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app.models.courses import Grade
+from app.utils.grade_stats import refresh_grade_stats_keys
+
+ACADEMIC_YEAR_START_MONTH = 9
+DEFAULT_PARTITION = "grade_default"
+
+
+def academic_year(day: date) -> int:
+    return day.year if day.month >= ACADEMIC_YEAR_START_MONTH else day.year - 1
+
+
+def partition_name(start_year: int) -> str:
+    return f"grade_{start_year}_{start_year + 1}"
+
+
+def partition_bounds(start_year: int):
+    return (date(start_year, ACADEMIC_YEAR_START_MONTH, 1),
+            date(start_year + 1, ACADEMIC_YEAR_START_MONTH, 1))
+
+
+GRADE_COLUMNS = ", ".join(column.name for column in Grade.__table__.columns)
+
+
+async def _table_exists(conn: AsyncConnection, name: str) -> bool:
+    return await conn.scalar(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name})
+
+
+async def _move_default_rows(conn: AsyncConnection, start: date, end: date):
+    """Re-inserts the rows of the (detached) default partition that fall in [start, end) through grade, so they
+    are routed to the year partitions."""
+    await conn.execute(text(
+        f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} "
+        f"WHERE date_assigned >= :start AND date_assigned < :end RETURNING {GRADE_COLUMNS}) "
+        f"INSERT INTO grade ({GRADE_COLUMNS}) SELECT {GRADE_COLUMNS} FROM moved"
+    ), {"start": start, "end": end})
+
+
+async def _create_partition(conn: AsyncConnection, start_year: int):
+    start, end = partition_bounds(start_year)
+    await conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {partition_name(start_year)} PARTITION OF grade "
+        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    ))
+
+
+async def create_grade_partitions(conn: AsyncConnection, start_years) -> list:
+    """Creates the missing year partitions. Postgres refuses to create a partition while the default partition
+    holds rows of its range, so in that case the default is detached, the rows are moved and it is re-attached."""
+    missing = [year for year in start_years if not await _table_exists(conn, partition_name(year))]
+    if not missing:
+        return []
+    has_default = await _table_exists(conn, DEFAULT_PARTITION)
+    first_start, last_end = partition_bounds(min(missing))[0], partition_bounds(max(missing))[1]
+    moving = has_default and await conn.scalar(text(
+        f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE date_assigned >= :start AND date_assigned < :end)"
+    ), {"start": first_start, "end": last_end})
+    if moving:
+        await conn.execute(text(f"ALTER TABLE grade DETACH PARTITION {DEFAULT_PARTITION}"))
+    for start_year in missing:
+        await _create_partition(conn, start_year)
+    if moving:
+        for start_year in missing:
+            await _move_default_rows(conn, *partition_bounds(start_year))
+        await conn.execute(text(f"ALTER TABLE grade ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT"))
+    return [partition_name(year) for year in missing]
+
+
+async def ensure_grade_partitions(conn: AsyncConnection, today: date = None, years_ahead: int = 1):
+    """Creates the partitions of the current academic year and the next ones, plus a default partition."""
+    current_year = academic_year(today or date.today())
+    await conn.execute(text(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF grade DEFAULT"))
+    await create_grade_partitions(conn, range(current_year, current_year + years_ahead + 1))
+
+
+async def backfill_grade_partitions(conn: AsyncConnection, today: date = None, years_ahead: int = 1) -> list:
+    """Gives every academic year since the oldest grade its own partition and moves those rows out of the default
+    partition, e.g. after copying an unpartitioned grade table in. Rows dated after the last ensured year stay in
+    the default partition."""
+    current_year = academic_year(today or date.today())
+    await conn.execute(text(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF grade DEFAULT"))
+    oldest = await conn.scalar(text("SELECT min(date_assigned) FROM grade"))
+    first_year = min(academic_year(oldest), current_year) if oldest is not None else current_year
+    return await create_grade_partitions(conn, range(first_year, current_year + years_ahead + 1))
+
+
+async def detach_grade_partition(conn: AsyncConnection, start_year: int):
+    """Detaches an academic year from grade; the rows stay in a standalone table that can be dumped or dropped.
+    The grade_stats rollups of everyone graded that year are recomputed from what is left in grade."""
+    name = partition_name(start_year)
+    await conn.execute(text(f"ALTER TABLE grade DETACH PARTITION {name}"))
+    keys = await conn.execute(text(f"SELECT DISTINCT group_id, user_id FROM {name}"))
+    await refresh_grade_stats_keys(conn, [tuple(key) for key in keys])
+
+
+async def main(command: str, year: int = None, years_ahead: int = 1):
+    from app.database import engine
+
+    async with engine.begin() as conn:
+        if command == "ensure":
+            await ensure_grade_partitions(conn, years_ahead=years_ahead)
+            print("grade partitions are in place")
+        elif command == "backfill":
+            created = await backfill_grade_partitions(conn, years_ahead=years_ahead)
+            print(f"{len(created)} partitions created: {', '.join(created)}" if created else "nothing to backfill")
+        else:
+            await detach_grade_partition(conn, year)
+            print(f"{partition_name(year)} detached")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage academic year partitions of the grade table.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    ensure_parser = subparsers.add_parser("ensure")
+    ensure_parser.add_argument("--years-ahead", type=int, default=1)
+    backfill_parser = subparsers.add_parser("backfill", help="partition the years of existing grades")
+    backfill_parser.add_argument("--years-ahead", type=int, default=1)
+    detach_parser = subparsers.add_parser("detach")
+    detach_parser.add_argument("year", type=int, help="first calendar year of the academic year, e.g. 2019")
+    args = parser.parse_args()
+    asyncio.run(main(args.command, getattr(args, "year", None), getattr(args, "years_ahead", 1)))
@@ -0,0 +1,147 @@
+import argparse
+import asyncio
+import math
+
+from sqlalchemy import select, delete, func, and_, or_, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.courses import Grade, GradeStats
+
+STATS_COLUMNS = ("group_id", "user_id", "grades_count", "grades_sum", "grades_sum_sq",
+                 "min_grade", "max_grade", "last_date")
+
+
+def grade_summary(count: int, total: int, total_sq: int):
+    if not count:
+        return {"count": 0, "average": None, "variance": None, "stddev": None}
+    average = total / count
+    variance = (total_sq - total * total / count) / (count - 1) if count > 1 else 0.0
+    variance = max(variance, 0.0)
+    return {"count": count, "average": average, "variance": variance, "stddev": math.sqrt(variance)}
+
+
+def aggregate_grades(rows):
+    """Folds (group_id, user_id, grade, date_assigned) rows into one grade_stats row per key."""
+    stats = {}
+    for group_id, user_id, grade, date_assigned in rows:
+        row = stats.get((group_id, user_id))
+        if row is None:
+            stats[(group_id, user_id)] = {
+                "group_id": group_id, "user_id": user_id, "grades_count": 1, "grades_sum": grade,
+                "grades_sum_sq": grade * grade, "min_grade": grade, "max_grade": grade, "last_date": date_assigned,
+            }
+            continue
+        row["grades_count"] += 1
+        row["grades_sum"] += grade
+        row["grades_sum_sq"] += grade * grade
+        row["min_grade"] = min(row["min_grade"], grade)
+        row["max_grade"] = max(row["max_grade"], grade)
+        row["last_date"] = max(row["last_date"], date_assigned)
+    return list(stats.values())
+
+
+def grade_stats_upsert(rows):
+    """Adds freshly inserted grades to the rollup; rows are (group_id, user_id, grade, date_assigned)."""
+    stmt = insert(GradeStats).values(aggregate_grades(rows))
+    return stmt.on_conflict_do_update(
+        index_elements=[GradeStats.group_id, GradeStats.user_id],
+        set_={
+            "grades_count": GradeStats.grades_count + stmt.excluded.grades_count,
+            "grades_sum": GradeStats.grades_sum + stmt.excluded.grades_sum,
+            "grades_sum_sq": GradeStats.grades_sum_sq + stmt.excluded.grades_sum_sq,
+            "min_grade": func.least(GradeStats.min_grade, stmt.excluded.min_grade),
+            "max_grade": func.greatest(GradeStats.max_grade, stmt.excluded.max_grade),
+            "last_date": func.greatest(GradeStats.last_date, stmt.excluded.last_date),
+        }
+    )
+
+
+def _grade_aggregate(*filters):
+    return (
+        select(
+            Grade.group_id,
+            Grade.user_id,
+            func.count(Grade.id),
+            func.sum(Grade.grade),
+            func.sum(Grade.grade * Grade.grade),
+            func.min(Grade.grade),
+            func.max(Grade.grade),
+            func.max(Grade.date_assigned),
+        )
+        .where(*filters)
+        .group_by(Grade.group_id, Grade.user_id)
+    )
+
+
+async def refresh_grade_stats(session: AsyncSession, group_id: int, user_id: int):
+    """Recomputes one rollup row from grade, for changes that cannot be applied incrementally (min/max)."""
+    await session.execute(
+        delete(GradeStats).where(GradeStats.group_id == group_id, GradeStats.user_id == user_id)
+    )
+    await session.execute(
+        insert(GradeStats).from_select(
+            STATS_COLUMNS, _grade_aggregate(Grade.group_id == group_id, Grade.user_id == user_id)
+        )
+    )
+
+
+async def refresh_grade_stats_keys(session: AsyncSession, keys, chunk_size: int = 5000):
+    """refresh_grade_stats for many (group_id, user_id) keys, two statements per chunk; keys without grades left
+    lose their rollup row."""
+    keys = list(keys)
+    for start in range(0, len(keys), chunk_size):
+        chunk = keys[start:start + chunk_size]
+        await session.execute(delete(GradeStats).where(tuple_(GradeStats.group_id, GradeStats.user_id).in_(chunk)))
+        await session.execute(
+            insert(GradeStats).from_select(
+                STATS_COLUMNS, _grade_aggregate(tuple_(Grade.group_id, Grade.user_id).in_(chunk))
+            )
+        )
+
+
+async def rebuild_grade_stats(session: AsyncSession):
+    await session.execute(delete(GradeStats))
+    await session.execute(insert(GradeStats).from_select(STATS_COLUMNS, _grade_aggregate()))
+
+
+async def verify_grade_stats(session: AsyncSession):
+    """Returns the (group_id, user_id) keys whose rollup row differs from the grade table."""
+    actual = _grade_aggregate().subquery()
+    columns = list(actual.c)
+    stored = [getattr(GradeStats, name) for name in STATS_COLUMNS]
+    stmt = (
+        select(func.coalesce(actual.c.group_id, GradeStats.group_id),
+               func.coalesce(actual.c.user_id, GradeStats.user_id))
+        .select_from(actual)
+        .join(GradeStats, and_(GradeStats.group_id == actual.c.group_id, GradeStats.user_id == actual.c.user_id),
+              full=True)
+        .where(or_(*[column.is_distinct_from(stored_column)
+                     for column, stored_column in zip(columns, stored)]))
+    )
+    result = await session.execute(stmt)
+    return result.all()
+
+
+async def main(command: str):
+    from app.database import async_session_maker
+
+    async with async_session_maker() as session:
+        if command == "rebuild":
+            await rebuild_grade_stats(session)
+            await session.commit()
+            print("grade_stats rebuilt")
+            return 0
+
+        mismatches = await verify_grade_stats(session)
+        for group_id, user_id in mismatches:
+            print(f"mismatch: group_id={group_id} user_id={user_id}")
+        print(f"{len(mismatches)} inconsistent grade_stats rows")
+        return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill or verify the grade_stats rollup table.")
+    parser.add_argument("command", choices=["rebuild", "verify"])
+    args = parser.parse_args()
+    raise SystemExit(asyncio.run(main(args.command)))
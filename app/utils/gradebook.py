@@ -0,0 +1,136 @@
+import csv
+import io
+import zipfile
+from xml.sax.saxutils import escape
+
+
+def build_gradebook(students, marks):
+    """Pivots (user_id, day, grade) rows into a students x days matrix; each cell holds that day's marks."""
+    dates = sorted({day for _, day, _ in marks})
+    columns = {day: index for index, day in enumerate(dates)}
+    rows = {student[0]: index for index, student in enumerate(students)}
+
+    matrix = [[[] for _ in dates] for _ in students]
+    for user_id, day, grade in marks:
+        row = rows.get(user_id)
+        if row is not None:
+            matrix[row][columns[day]].append(grade)
+
+    return {
+        "dates": dates,
+        "students": [
+            {"id": student_id, "first_name": first_name, "last_name": last_name,
+             "average": _average(cells)}
+            for (student_id, first_name, last_name), cells in zip(students, matrix)
+        ],
+        "marks": matrix,
+    }
+
+
+def _average(cells):
+    grades = [grade for cell in cells for grade in cell]
+    return round(sum(grades) / len(grades), 2) if grades else None
+
+
+def _format_cell(cell):
+    return " ".join(map(str, cell))
+
+
+def _header(gradebook):
+    return ["id", "first_name", "last_name"] + [day.isoformat() for day in gradebook["dates"]] + ["average"]
+
+
+def _rows(gradebook):
+    for student, cells in zip(gradebook["students"], gradebook["marks"]):
+        yield [student["id"], student["first_name"], student["last_name"]] + cells + [student["average"]]
+
+
+def iter_gradebook_csv(gradebook, chunk_rows: int = 500):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(_header(gradebook))
+    for index, row in enumerate(_rows(gradebook), start=1):
+        writer.writerow([_format_cell(value) if isinstance(value, list) else value for value in row])
+        if index % chunk_rows == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _column_name(index: int) -> str:
+    name = ""
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        name = chr(ord("A") + remainder) + name
+    return name
+
+
+def _xlsx_cell(reference: str, value) -> str:
+    if isinstance(value, list):
+        value = value[0] if len(value) == 1 else _format_cell(value)
+    if value is None or value == "":
+        return ""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f'<c r="{reference}"><v>{value}</v></c>'
+    return f'<c r="{reference}" t="inlineStr"><is><t>{escape(str(value))}</t></is></c>'
+
+
+_XLSX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+_XLSX_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_XLSX_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="Gradebook" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+_XLSX_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+
+
+def gradebook_xlsx(gradebook) -> bytes:
+    sheet_rows = []
+    for row_number, row in enumerate([_header(gradebook), *_rows(gradebook)], start=1):
+        cells = "".join(_xlsx_cell(f"{_column_name(column)}{row_number}", value)
+                        for column, value in enumerate(row))
+        sheet_rows.append(f'<row r="{row_number}">{cells}</row>')
+    sheet = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        f'<sheetData>{"".join(sheet_rows)}</sheetData>'
+        '</worksheet>'
+    )
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as workbook:
+        workbook.writestr("[Content_Types].xml", _XLSX_CONTENT_TYPES)
+        workbook.writestr("_rels/.rels", _XLSX_ROOT_RELS)
+        workbook.writestr("xl/workbook.xml", _XLSX_WORKBOOK)
+        workbook.writestr("xl/_rels/workbook.xml.rels", _XLSX_WORKBOOK_RELS)
+        workbook.writestr("xl/worksheets/sheet1.xml", sheet)
+    return buffer.getvalue()
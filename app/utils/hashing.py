@@ -0,0 +1,55 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+from fastapi_users.password import PasswordHelper
+
+_password_helper: Optional[PasswordHelper] = None
+
+
+def _hash_chunk(passwords: List[str]) -> List[str]:
+    # runs in a worker process; the helper is built once per worker
+    global _password_helper
+    if _password_helper is None:
+        _password_helper = PasswordHelper()
+    return [_password_helper.hash(password) for password in passwords]
+
+
+class PasswordHashingPool:
+    """Hashes passwords in worker processes so argon2 doesn't block the event loop or hold the GIL."""
+
+    def __init__(self, max_workers: Optional[int] = None, chunk_size: int = 16):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.pending = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # created lazily, once the logging listener and anyio's worker threads are running, and forking a
+            # multi-threaded process can deadlock the child; forkserver workers fork from a clean process
+            start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                 mp_context=multiprocessing.get_context(start_method))
+        return self._executor
+
+    async def hash_many(self, passwords: List[str]) -> List[str]:
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        chunks = [passwords[i:i + self.chunk_size] for i in range(0, len(passwords), self.chunk_size)]
+        self.pending += len(passwords)
+        try:
+            results = await asyncio.gather(*(loop.run_in_executor(executor, _hash_chunk, chunk) for chunk in chunks))
+        finally:
+            self.pending -= len(passwords)
+        return [hashed for chunk in results for hashed in chunk]
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_hashing_pool = PasswordHashingPool()
@@ -0,0 +1,88 @@
+import logging
+import queue
+import sys
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, List, Optional, Tuple
+
+import orjson
+
+request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+# attributes every LogRecord has; anything else on a record came in through extra= and is emitted as is
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "request_id"}
+
+
+class ContextQueueHandler(QueueHandler):
+    """Runs on the logging thread: captures the request id (contextvars don't reach the listener thread) and
+    renders the message and traceback, so only plain values cross the queue."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.request_id = request_id.get()
+        record.message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg, record.args, record.exc_info = record.message, None, None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+        }
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        entry.update((key, value) for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES)
+        return orjson.dumps(entry, default=str).decode()
+
+
+# uvicorn configures these with their own stream handlers and propagate=False, which would keep the access log
+# writing synchronously from the event loop and outside the JSON format
+UVICORN_LOGGERS = ("uvicorn", "uvicorn.error", "uvicorn.access")
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional[ContextQueueHandler] = None
+_uvicorn_config: Dict[str, Tuple[List[logging.Handler], bool]] = {}
+
+
+def start_logging(level: str = "INFO", stream=None):
+    """Routes the root logger, and uvicorn's loggers through it, into an unbounded queue; a listener thread
+    formats the records as JSON lines and does the writing, so a slow stdout never blocks the event loop."""
+    global _listener, _queue_handler
+    if _listener is not None:
+        return
+    log_queue = queue.SimpleQueue()
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter())
+    _queue_handler = ContextQueueHandler(log_queue)
+    root = logging.getLogger()
+    root.addHandler(_queue_handler)
+    root.setLevel(level)
+    for name in UVICORN_LOGGERS:
+        uvicorn_logger = logging.getLogger(name)
+        _uvicorn_config[name] = (uvicorn_logger.handlers[:], uvicorn_logger.propagate)
+        uvicorn_logger.handlers.clear()
+        uvicorn_logger.propagate = True
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+
+
+def stop_logging():
+    """Flushes what is still queued, detaches the handler and gives uvicorn its own handlers back."""
+    global _listener, _queue_handler
+    if _listener is None:
+        return
+    logging.getLogger().removeHandler(_queue_handler)
+    for name, (handlers, propagate) in _uvicorn_config.items():
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers[:] = handlers
+        uvicorn_logger.propagate = propagate
+    _uvicorn_config.clear()
+    _listener.stop()
+    _listener, _queue_handler = None, None
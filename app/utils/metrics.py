@@ -0,0 +1,208 @@
+from bisect import bisect_left
+from time import perf_counter
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_labels(self.labelnames, labels)} {value}" for labels, value in self._values.items()]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # per label set: [per-bucket counts (non-cumulative, last one is +Inf), sum]
+        self._values: Dict[Tuple, list] = {}
+
+    def observe(self, seconds: float, *labels):
+        value = self._values.get(labels)
+        if value is None:
+            value = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        value[0][bisect_left(self.buckets, seconds)] += 1
+        value[1] += seconds
+
+    def count(self, *labels) -> int:
+        value = self._values.get(labels)
+        return sum(value[0]) if value else 0
+
+    def samples(self) -> List[str]:
+        lines = []
+        for labels, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                bucket_labels = _labels(self.labelnames, labels, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """Read when scraped; collect returns (label values, value) pairs. kind="counter" exposes values that
+    something else already counts (e.g. TTLCache.hits)."""
+
+    def __init__(self, name: str, documentation: str, collect: Callable, labelnames: Iterable[str] = (),
+                 kind: str = "gauge"):
+        self.kind = kind
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_labels(self.labelnames, labels)} {value}" for labels, value in self.collect()]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                  buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name: str, documentation: str, collect: Callable, labelnames: Iterable[str] = (),
+              kind: str = "gauge") -> Gauge:
+        return self.register(Gauge(name, documentation, collect, labelnames, kind))
+
+    def render(self) -> str:
+        """Prometheus text exposition format, version 0.0.4."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {_escape(metric.documentation)}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+http_requests = registry.counter("http_requests_total", "HTTP requests by route and status code",
+                                 ("method", "route", "status"))
+http_request_duration = registry.histogram("http_request_duration_seconds", "HTTP request latency by route",
+                                           ("method", "route"))
+db_queries = registry.counter("db_queries_total", "SQL statements executed, by first keyword", ("operation",))
+db_query_duration = registry.histogram("db_query_duration_seconds", "SQL statement duration, by first keyword",
+                                       ("operation",))
+db_pool_checkouts = registry.counter("db_pool_checkouts_total", "Connections handed out by the pool")
+db_pool_timeouts = registry.counter("db_pool_timeouts_total", "Checkouts that gave up waiting for a connection")
+db_pool_wait = registry.histogram("db_pool_wait_seconds", "Time spent waiting for a pooled connection",
+                                  buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0))
+
+
+def observe_request(method: str, route: str, status_code: int, seconds: float):
+    http_requests.inc(method, route, status_code)
+    http_request_duration.observe(seconds, method, route)
+
+
+def observe_query(statement: str, seconds: float):
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "UNKNOWN"
+    db_queries.inc(operation)
+    db_query_duration.observe(seconds, operation)
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Records how long checkouts wait for a free connection, which pool events don't expose."""
+
+    def _do_get(self):
+        started = perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            db_pool_timeouts.inc()
+            raise
+        finally:
+            db_pool_wait.observe(perf_counter() - started)
+        db_pool_checkouts.inc()
+        return connection
+
+
+def register_pool(engine):
+    # engine.pool is looked up on every scrape because dispose() replaces it
+    registry.gauge("db_pool_size", "Configured pool size", lambda: [((), engine.pool.size())])
+    registry.gauge("db_pool_checked_out", "Connections currently checked out",
+                   lambda: [((), engine.pool.checkedout())])
+    registry.gauge("db_pool_overflow", "Connections open beyond the pool size",
+                   lambda: [((), max(engine.pool.overflow(), 0))])
+
+
+def register_hashing_pool(pool):
+    registry.gauge("password_hash_queue_depth", "Passwords submitted to the hashing pool and not yet hashed",
+                   lambda: [((), pool.pending)])
+    registry.gauge("password_hash_workers", "Hashing pool worker processes", lambda: [((), pool.max_workers)])
+
+
+_caches = {}
+
+
+def register_cache(name: str, cache):
+    _caches[name] = cache
+
+
+def _cache_values(attribute: str):
+    values = []
+    for name, cache in _caches.items():
+        value = getattr(cache, attribute)
+        values.append(((name,), value() if callable(value) else value))
+    return values
+
+
+def _cache_hit_ratios():
+    ratios = []
+    for name, cache in _caches.items():
+        lookups = cache.hits + cache.misses
+        ratios.append(((name,), cache.hits / lookups if lookups else 0.0))
+    return ratios
+
+
+registry.gauge("cache_hits_total", "Cache lookups that returned a value", lambda: _cache_values("hits"), ("cache",),
+               kind="counter")
+registry.gauge("cache_misses_total", "Cache lookups that missed or found an expired entry",
+               lambda: _cache_values("misses"), ("cache",), kind="counter")
+registry.gauge("cache_hit_ratio", "hits / (hits + misses) since start", _cache_hit_ratios, ("cache",))
+registry.gauge("cache_entries", "Entries currently held", lambda: _cache_values("__len__"), ("cache",))
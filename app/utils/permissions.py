@@ -0,0 +1,95 @@
+import logging
+from enum import Enum, IntFlag
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.courses import Role
+
+logger = logging.getLogger("permissions")
+
+
+class Permission(IntFlag):
+    STUDY = 1
+    TEACH = 2
+    MANAGE_COURSES = 4
+    MANAGE_USERS = 8
+    MODERATE_COMMENTS = 16
+
+
+PermissionName = Enum("PermissionName",
+                      {permission.name: permission.name.lower() for permission in Permission}, type=str)
+
+NO_PERMISSIONS = Permission(0)
+FALLBACK_DEFAULT_ROLE_ID = 2
+# roles created before Role.permissions was filled in keep behaving as they used to
+LEGACY_ROLE_PERMISSIONS = {
+    2: Permission.STUDY,
+    3: Permission.TEACH,
+}
+
+
+def compile_permissions(names) -> Permission:
+    """Folds the Role.permissions JSON (a list of names, or a {name: bool} map) into a bitset."""
+    if isinstance(names, dict):
+        names = [name for name, granted in names.items() if granted]
+    flags = NO_PERMISSIONS
+    for name in names or ():
+        try:
+            flags |= Permission[str(name).upper()]
+        except KeyError:
+            logger.warning(f"unknown permission {name!r} ignored")
+    return flags
+
+
+def permission_names(flags: Permission) -> List[str]:
+    return [permission.name.lower() for permission in Permission if permission in flags]
+
+
+class PermissionRegistry:
+    """role_id -> Permission bitset, so permission checks never touch the database."""
+
+    def __init__(self):
+        self._roles: Dict[int, Permission] = {}
+
+    def load(self, roles: Iterable[Tuple[int, object]]):
+        compiled = {}
+        for role_id, names in roles:
+            if names is None and role_id in LEGACY_ROLE_PERMISSIONS:
+                compiled[role_id] = LEGACY_ROLE_PERMISSIONS[role_id]
+            else:
+                compiled[role_id] = compile_permissions(names)
+        self._roles = compiled
+
+    def set_role(self, role_id: int, names):
+        roles = dict(self._roles)
+        roles[role_id] = compile_permissions(names)
+        self._roles = roles
+
+    def permissions(self, role_id: Optional[int]) -> Permission:
+        if not self._roles:
+            return LEGACY_ROLE_PERMISSIONS.get(role_id, NO_PERMISSIONS)
+        return self._roles.get(role_id, NO_PERMISSIONS)
+
+    def has(self, role_id: Optional[int], required: Permission) -> bool:
+        return self.permissions(role_id) & required == required
+
+    def role_ids_with(self, required: Permission) -> List[int]:
+        roles = self._roles or LEGACY_ROLE_PERMISSIONS
+        return sorted(role_id for role_id, flags in roles.items() if flags & required == required)
+
+    def default_role_id(self) -> int:
+        """The lowest role that can study and has no staff permissions."""
+        for role_id in self.role_ids_with(Permission.STUDY):
+            if self.permissions(role_id) == Permission.STUDY:
+                return role_id
+        return FALLBACK_DEFAULT_ROLE_ID
+
+    async def refresh(self, session: AsyncSession):
+        query = await session.execute(select(Role.id, Role.permissions))
+        self.load(query.all())
+        logger.info(f"loaded permissions of {len(self._roles)} roles")
+
+
+role_permissions = PermissionRegistry()
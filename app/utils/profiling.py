@@ -0,0 +1,138 @@
+import cProfile
+import io
+import logging
+import pstats
+from collections import OrderedDict
+from typing import Optional, Tuple
+from urllib.parse import parse_qs
+from uuid import uuid4
+
+import jwt
+from fastapi_users.jwt import decode_jwt
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.config.auth import SECRET
+from app.database import async_session_maker
+from app.models.courses import User
+
+try:
+    from pyinstrument import Profiler
+except ImportError:  # optional; cProfile is used instead
+    Profiler = None
+
+logger = logging.getLogger("app.profiling")
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_ID_HEADER = b"x-profile-id"
+TOKEN_AUDIENCE = ["fastapi-users:auth"]
+
+
+def profile_requested(scope) -> bool:
+    """X-Profile: 1 header or ?profile=1; this is all a request pays when profiling isn't asked for."""
+    for name, value in scope["headers"]:
+        if name == PROFILE_HEADER:
+            return value.lower() in (b"1", b"true")
+    query_string = scope.get("query_string", b"")
+    if b"profile=" not in query_string:
+        return False
+    return parse_qs(query_string.decode("latin-1")).get("profile", [""])[-1].lower() in ("1", "true")
+
+
+def _bearer_token(scope) -> Optional[str]:
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            return token if scheme.lower() == "bearer" and token else None
+    return None
+
+
+async def is_superuser(scope) -> bool:
+    token = _bearer_token(scope)
+    if token is None:
+        return False
+    try:
+        user_id = int(decode_jwt(token, SECRET, TOKEN_AUDIENCE)["sub"])
+    except (jwt.PyJWTError, KeyError, ValueError):
+        return False
+    try:
+        async with async_session_maker() as session:
+            row = (await session.execute(
+                select(User.is_active, User.is_superuser).where(User.id == user_id)
+            )).first()
+    except (SQLAlchemyError, OSError) as e:
+        logger.error(f"could not check profiling permissions: {str(e)}")
+        return False
+    return row is not None and row.is_active and row.is_superuser
+
+
+class ProfileStore:
+    def __init__(self, maxlen: int = 20):
+        self.maxlen = maxlen
+        self._profiles: "OrderedDict[str, Tuple[str, str]]" = OrderedDict()
+
+    def add(self, profile_id: str, media_type: str, content: str):
+        self._profiles[profile_id] = (media_type, content)
+        while len(self._profiles) > self.maxlen:
+            self._profiles.popitem(last=False)
+
+    def get(self, profile_id: str) -> Optional[Tuple[str, str]]:
+        return self._profiles.get(profile_id)
+
+
+profiles = ProfileStore()
+
+
+class RequestProfiler:
+    """pyinstrument when it is installed (an HTML flame graph of the request's own task and the tasks it
+    spawns), otherwise cProfile, whose pstats report also includes whatever else ran on the event loop."""
+
+    def __init__(self):
+        self._profiler = Profiler(interval=0.001, async_mode="enabled") if Profiler else cProfile.Profile()
+
+    def start(self):
+        if Profiler:
+            self._profiler.start()
+        else:
+            self._profiler.enable()
+
+    def stop(self) -> Tuple[str, str]:
+        if Profiler:
+            self._profiler.stop()
+            return "text/html", self._profiler.output_html()
+        self._profiler.disable()
+        output = io.StringIO()
+        pstats.Stats(self._profiler, stream=output).sort_stats(pstats.SortKey.CUMULATIVE).print_stats(80)
+        return "text/plain", output.getvalue()
+
+
+class ProfilingMiddleware:
+    """Profiles a single request for a superuser who asks for it. Plain ASGI rather than @app.middleware so
+    the profiler wraps every other middleware, the dependencies, the endpoint and the response body in the
+    task the profiler is started from. One request is profiled at a time; other flagged requests run as usual."""
+
+    def __init__(self, app):
+        self.app = app
+        self._busy = False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not profile_requested(scope) or self._busy or not await is_superuser(scope):
+            await self.app(scope, receive, send)
+            return
+        self._busy = True
+        profile_id = uuid4().hex
+
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []),
+                                                  (PROFILE_ID_HEADER, profile_id.encode())]}
+            await send(message)
+
+        profiler = RequestProfiler()
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            media_type, content = profiler.stop()
+            profiles.add(profile_id, media_type, content)
+            self._busy = False
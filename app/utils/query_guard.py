@@ -0,0 +1,97 @@
+import logging
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import event
+from starlette.routing import Match
+
+from app.config.config import settings
+
+logger = logging.getLogger("query_guard")
+
+# counting every statement is cheap, but the repeated-statement report is noisy for production logs
+GUARD_ENABLED = settings.app_env in ("development", "test")
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryCounter:
+    def __init__(self):
+        self.statements: List[str] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def repeated(self) -> Dict[str, int]:
+        """Statements issued more than once with the same SQL text, the usual shape of an N+1."""
+        return {statement: times for statement, times in Counter(self.statements).items() if times > 1}
+
+    def check(self, budget: Optional[int], label: str = "block"):
+        if budget is not None and self.count > budget:
+            raise QueryBudgetExceeded(f"{label} ran {self.count} queries, budget is {budget}:\n" +
+                                      "\n".join(self.statements))
+
+
+query_counter: ContextVar[Optional[QueryCounter]] = ContextVar("query_counter", default=None)
+
+
+@contextmanager
+def count_queries():
+    counter = QueryCounter()
+    token = query_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        query_counter.reset(token)
+
+
+def install_query_guard(engine):
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        counter = query_counter.get()
+        if counter is not None:
+            counter.statements.append(statement)
+
+
+def query_budget(queries: int) -> Callable:
+    """Declares how many queries a route may run, dependencies (auth included) counted."""
+
+    def decorator(endpoint: Callable) -> Callable:
+        endpoint.query_budget = queries
+        return endpoint
+
+    return decorator
+
+
+def route_budget(route) -> Optional[int]:
+    return getattr(getattr(route, "endpoint", None), "query_budget", None)
+
+
+def match_route(routes, scope):
+    for route in routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route
+    return None
+
+
+# the latest overruns only, so a long-running dev server doesn't accumulate them
+budget_violations = deque(maxlen=100)
+
+
+def report_request(route, counter: QueryCounter, label: str):
+    """Logs repeated statements and budget overruns; overruns are also kept for the test suite to fail on."""
+    for statement, times in counter.repeated().items():
+        logger.warning(f"{label}: statement repeated {times} times: {statement}")
+    try:
+        counter.check(route_budget(route), label)
+    except QueryBudgetExceeded as e:
+        logger.warning(str(e))
+        budget_violations.append(str(e))
@@ -0,0 +1,24 @@
+from functools import lru_cache
+from typing import Any
+
+from fastapi import Response, status
+from pydantic import TypeAdapter
+
+from app.utils.timing import timed_serialization
+
+
+@lru_cache(maxsize=None)
+def type_adapter(schema: Any) -> TypeAdapter:
+    """TypeAdapters are expensive to build, so there is one per schema (e.g. List[CommentsSchema])."""
+    return TypeAdapter(schema)
+
+
+@timed_serialization
+def dump_json(schema: Any, data: Any) -> bytes:
+    """Validates ORM objects, rows or dicts against schema and serializes them in one pass through pydantic-core."""
+    adapter = type_adapter(schema)
+    return adapter.dump_json(adapter.validate_python(data, from_attributes=True))
+
+
+def json_response(schema: Any, data: Any, status_code: int = status.HTTP_200_OK) -> Response:
+    return Response(content=dump_json(schema, data), status_code=status_code, media_type="application/json")
@@ -0,0 +1,105 @@
+import hashlib
+import re
+from collections import Counter
+
+FINGERPRINT_BITS = 64
+SHINGLE_SIZE = 4
+MIN_TEXT_LENGTH = 20
+
+_NON_WORD = re.compile(r"[\W_]+", re.UNICODE)
+
+
+def normalize(text: str) -> str:
+    return " ".join(_NON_WORD.sub(" ", text.lower()).split())
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE):
+    text = normalize(text)
+    if len(text) <= size:
+        return [text]
+    return [text[i:i + size] for i in range(len(text) - size + 1)]
+
+
+def _hash(shingle: str) -> int:
+    return int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), "big")
+
+
+def simhash(text: str):
+    """64-bit SimHash over character shingles; None for texts too short to fingerprint reliably."""
+    if len(normalize(text)) < MIN_TEXT_LENGTH:
+        return None
+    weights = [0] * FINGERPRINT_BITS
+    for shingle, count in Counter(shingles(text)).items():
+        value = _hash(shingle)
+        for bit in range(FINGERPRINT_BITS):
+            weights[bit] += count if value >> bit & 1 else -count
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def to_signed(fingerprint: int) -> int:
+    """Maps an unsigned 64-bit fingerprint onto a Postgres BIGINT."""
+    return fingerprint - (1 << 64) if fingerprint >= 1 << 63 else fingerprint
+
+
+def to_unsigned(fingerprint: int) -> int:
+    return fingerprint + (1 << 64) if fingerprint < 0 else fingerprint
+
+
+class SimHashIndex:
+    """In-memory LSH over SimHash fingerprints.
+
+    The fingerprint is cut into max_distance + 1 bands, so by the pigeonhole principle any two fingerprints
+    within max_distance bits agree on at least one whole band; a lookup only compares against the keys that
+    share a band with the query.
+    """
+
+    def __init__(self, max_distance: int = 6):
+        self.max_distance = max_distance
+        self.bands = max_distance + 1
+        self.band_bits = FINGERPRINT_BITS // self.bands
+        self._tables = [{} for _ in range(self.bands)]
+        self._entries = {}
+
+    def _band_values(self, fingerprint: int):
+        mask = (1 << self.band_bits) - 1
+        return [fingerprint >> (band * self.band_bits) & mask for band in range(self.bands)]
+
+    def add(self, key, fingerprint: int, status: str):
+        self.remove(key)
+        self._entries[key] = (fingerprint, status)
+        for table, value in zip(self._tables, self._band_values(fingerprint)):
+            table.setdefault(value, set()).add(key)
+
+    def remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for table, value in zip(self._tables, self._band_values(entry[0])):
+            keys = table.get(value)
+            keys.discard(key)
+            if not keys:
+                del table[value]
+
+    def find_near(self, fingerprint: int):
+        candidates = set()
+        for table, value in zip(self._tables, self._band_values(fingerprint)):
+            candidates.update(table.get(value, ()))
+        matches = []
+        for key in candidates:
+            candidate, status = self._entries[key]
+            distance = hamming_distance(fingerprint, candidate)
+            if distance <= self.max_distance:
+                matches.append((key, status, distance))
+        return sorted(matches, key=lambda match: match[2])
+
+    def clear(self):
+        for table in self._tables:
+            table.clear()
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
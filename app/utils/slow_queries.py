@@ -0,0 +1,183 @@
+import asyncio
+import contextvars
+import logging
+import random
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from itertools import count
+from time import perf_counter
+from typing import List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.config.config import db_settings
+from app.utils.timing import request_timings
+
+logger = logging.getLogger("app.slow_queries")
+
+# statements EXPLAIN ANALYZE may run for real; anything else only gets a plain EXPLAIN
+READ_ONLY_OPERATIONS = ("SELECT", "WITH", "VALUES", "TABLE")
+MAX_PARAMETERS_LENGTH = 1000
+# statements on these tables bind password hashes, emails and phone numbers; only the parameter types are kept
+SENSITIVE_TABLES = ('"user"',)
+
+# set inside the capture task so the EXPLAIN doesn't get logged (and explained) as a slow query itself
+_capturing: ContextVar[bool] = ContextVar("capturing_plan", default=False)
+
+
+class SlowQuery:
+    __slots__ = ("id", "statement", "parameters", "route", "duration_ms", "executed_at", "plan")
+
+    def __init__(self, id: int, statement: str, parameters, route: Optional[str], duration_ms: float):
+        self.id = id
+        self.statement = statement
+        self.parameters = parameters
+        self.route = route
+        self.duration_ms = duration_ms
+        self.executed_at = datetime.now(timezone.utc)
+        self.plan: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "statement": self.statement,
+            "parameters": _format_parameters(self.parameters),
+            "route": self.route,
+            "duration_ms": self.duration_ms,
+            "executed_at": self.executed_at.isoformat(),
+            "plan": self.plan,
+        }
+
+
+def _format_parameters(parameters) -> str:
+    text = repr(parameters)
+    return text if len(text) <= MAX_PARAMETERS_LENGTH else text[:MAX_PARAMETERS_LENGTH] + "..."
+
+
+def redact_parameters(statement: str, parameters):
+    """The parameters as they may be logged and shown at /slow_queries: values bound in statements on a sensitive
+    table are replaced by their type names."""
+    if not any(table in statement for table in SENSITIVE_TABLES):
+        return parameters
+    return _type_names(parameters)
+
+
+def _type_names(parameters):
+    if isinstance(parameters, dict):
+        return {name: _type_names(value) for name, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return type(parameters)(_type_names(value) for value in parameters)
+    return type(parameters).__name__
+
+
+def _string_values(parameters):
+    if isinstance(parameters, dict):
+        parameters = list(parameters.values())
+    if isinstance(parameters, (list, tuple)):
+        for value in parameters:
+            yield from _string_values(value)
+    elif isinstance(parameters, str) and parameters:
+        yield parameters
+
+
+def mask_values(statement: str, parameters, text: str) -> str:
+    """Postgres prints bound values into plans (and some errors) as literals; for sensitive statements the string
+    values are masked there as well."""
+    if not any(table in statement for table in SENSITIVE_TABLES):
+        return text
+    for value in sorted(set(_string_values(parameters)), key=len, reverse=True):
+        text = text.replace(value.replace("'", "''"), "***").replace(value, "***")
+    return text
+
+
+def is_read_only(statement: str) -> bool:
+    words = statement.lstrip().split(None, 1)
+    return bool(words) and words[0].upper() in READ_ONLY_OPERATIONS
+
+
+class SlowQueryLog:
+    """Keeps the last maxlen statements that ran longer than threshold_ms. A sample of them is re-run under
+    EXPLAIN (ANALYZE, BUFFERS) on a separate connection, one at a time, and the plan is attached to the entry.
+    The entries live in this process only; every slow query and captured plan also goes to the app.slow_queries
+    logger, which is what survives a restart."""
+
+    def __init__(self, threshold_ms: float, explain_sample_rate: float = 0.1, maxlen: int = 200):
+        self.threshold_ms = threshold_ms
+        self.explain_sample_rate = explain_sample_rate
+        self.entries = deque(maxlen=maxlen)
+        self._ids = count(1)
+        self._capture_task: Optional[asyncio.Task] = None
+
+    def record(self, statement: str, parameters, duration_ms: float) -> Optional[SlowQuery]:
+        if duration_ms < self.threshold_ms or _capturing.get():
+            return None
+        timings = request_timings.get()
+        entry = SlowQuery(next(self._ids), statement, redact_parameters(statement, parameters),
+                          getattr(timings, "route", None), round(duration_ms, 2))
+        self.entries.append(entry)
+        logger.warning(f"slow query {entry.duration_ms}ms route={entry.route}: {statement} "
+                       f"parameters={_format_parameters(entry.parameters)}")
+        return entry
+
+    def should_explain(self) -> bool:
+        return (self._capture_task is None or self._capture_task.done()) and \
+            random.random() < self.explain_sample_rate
+
+    def schedule_explain(self, engine: AsyncEngine, entry: SlowQuery, parameters):
+        """parameters are the raw ones the statement ran with; the entry only has the redacted copy."""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        # a fresh context: a copy of the request's would count the capture's statements against that request's
+        # query budget and Server-Timing
+        self._capture_task = loop.create_task(self.explain(engine, entry, parameters), context=contextvars.Context())
+
+    async def explain(self, engine: AsyncEngine, entry: SlowQuery, parameters):
+        _capturing.set(True)
+        explain = "EXPLAIN (ANALYZE, BUFFERS)" if is_read_only(entry.statement) else "EXPLAIN"
+        try:
+            async with engine.connect() as conn:
+                # the statement really runs again under ANALYZE, so it gets a hard ceiling
+                timeout_ms = int(max(self.threshold_ms * 10, 5000))
+                await conn.exec_driver_sql(f"SET LOCAL statement_timeout = {timeout_ms}")
+                result = await conn.exec_driver_sql(f"{explain} {entry.statement}", parameters)
+                entry.plan = mask_values(entry.statement, parameters, "\n".join(row[0] for row in result))
+                await conn.rollback()
+            logger.info(f"plan for slow query {entry.id}", extra={
+                "slow_query_id": entry.id, "route": entry.route, "duration_ms": entry.duration_ms,
+                "statement": entry.statement, "plan": entry.plan,
+            })
+        except (SQLAlchemyError, OSError) as e:
+            logger.error(f"could not capture plan for slow query {entry.id}: "
+                         f"{mask_values(entry.statement, parameters, str(e))}")
+
+    def recent(self, limit: int = 50) -> List[dict]:
+        return [entry.to_dict() for entry in reversed(self.entries)][:limit]
+
+
+slow_query_log = SlowQueryLog(db_settings.slow_query_ms, db_settings.slow_query_explain_sample)
+
+
+def install_slow_query_log(engine, log: SlowQueryLog):
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("slow_query_started", []).append(perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        duration_ms = (perf_counter() - conn.info["slow_query_started"].pop()) * 1000
+        entry = log.record(statement, parameters, duration_ms)
+        if entry is not None and not executemany and isinstance(engine, AsyncEngine) and log.should_explain():
+            log.schedule_explain(engine, entry, parameters)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def handle_error(exception_context):
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("slow_query_started"):
+            connection.info["slow_query_started"].pop()
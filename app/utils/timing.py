@@ -0,0 +1,140 @@
+import asyncio
+import functools
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Callable, Optional
+
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.utils.metrics import observe_query
+
+
+class RequestTimings:
+    """Per-request counters; the object is shared with child tasks through request_timings, so it is mutated,
+    never replaced."""
+
+    __slots__ = ("started", "route", "db_time", "db_count", "route_started", "endpoint_started", "endpoint_finished",
+                 "route_finished", "serialize_time")
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.route = None
+        self.db_time = 0.0
+        self.db_count = 0
+        self.route_started = None
+        self.endpoint_started = None
+        self.endpoint_finished = None
+        self.route_finished = None
+        self.serialize_time = 0.0
+
+    def breakdown(self, finished: Optional[float] = None) -> dict:
+        """Durations in milliseconds. deps covers body parsing and dependencies (auth included), handler is the
+        endpoint itself, serialize is the in-endpoint JSON encoding plus FastAPI's response serialization."""
+        finished = finished or perf_counter()
+        timings = {"total": finished - self.started, "db": self.db_time}
+        if self.route_started is not None and self.endpoint_started is not None:
+            timings["deps"] = self.endpoint_started - self.route_started
+        if self.endpoint_started is not None and self.endpoint_finished is not None:
+            timings["handler"] = self.endpoint_finished - self.endpoint_started - self.serialize_time
+        serialize = self.serialize_time
+        if self.endpoint_finished is not None and self.route_finished is not None:
+            serialize += self.route_finished - self.endpoint_finished
+        timings["serialize"] = serialize
+        return {name: round(seconds * 1000, 2) for name, seconds in timings.items()}
+
+    def server_timing(self, breakdown: Optional[dict] = None) -> str:
+        parts = []
+        for name, duration in (breakdown or self.breakdown()).items():
+            description = f';desc="{self.db_count} queries"' if name == "db" else ""
+            parts.append(f"{name};dur={duration}{description}")
+        return ", ".join(parts)
+
+
+request_timings: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+def add_serialization_time(seconds: float):
+    timings = request_timings.get()
+    if timings is not None:
+        timings.serialize_time += seconds
+
+
+def timed_serialization(func: Callable) -> Callable:
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            add_serialization_time(perf_counter() - started)
+
+    return wrapper
+
+
+def install_query_timing(engine: AsyncEngine):
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(perf_counter())
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = perf_counter() - conn.info["query_started"].pop()
+        observe_query(statement, elapsed)
+        timings = request_timings.get()
+        if timings is not None:
+            timings.db_time += elapsed
+            timings.db_count += 1
+
+    @event.listens_for(engine.sync_engine, "handle_error")
+    def handle_error(exception_context):
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("query_started"):
+            connection.info["query_started"].pop()
+
+
+class TimedRoute(APIRoute):
+    """Marks where dependency resolution ends and where the endpoint returns, so the request can be split into
+    deps / handler / serialize."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        call = self.dependant.call
+        if asyncio.iscoroutinefunction(call):
+            @functools.wraps(call)
+            async def timed_call(*call_args, **call_kwargs):
+                timings = request_timings.get()
+                if timings is None:
+                    return await call(*call_args, **call_kwargs)
+                timings.endpoint_started = perf_counter()
+                try:
+                    return await call(*call_args, **call_kwargs)
+                finally:
+                    timings.endpoint_finished = perf_counter()
+        else:
+            @functools.wraps(call)
+            def timed_call(*call_args, **call_kwargs):
+                timings = request_timings.get()
+                if timings is None:
+                    return call(*call_args, **call_kwargs)
+                timings.endpoint_started = perf_counter()
+                try:
+                    return call(*call_args, **call_kwargs)
+                finally:
+                    timings.endpoint_finished = perf_counter()
+        self.dependant.call = timed_call
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def timed_handler(request):
+            timings = request_timings.get()
+            if timings is not None:
+                timings.route_started = perf_counter()
+            response = await handler(request)
+            if timings is not None:
+                timings.route_finished = perf_counter()
+            return response
+
+        return timed_handler